@@ -1,70 +1,314 @@
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 from pymongo import MongoClient
-from model import ComprehensiveRecommendationModel
-from customer import AdvancedCustomerAnalytics
-from discount import ExpiryManagementSystem
-from supplier import SupplierAnalysis
-import json
-from bson import ObjectId
-import pandas as pd
-
-class JSONEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, ObjectId):
-            return str(o)
-        return json.JSONEncoder.default(self, o)
+from engines import LazyEngine, load, prewarm
+from snapshot import DataSnapshot
+from loader import load_suppliers
+from registry import ModelRegistry, DEFAULT_MODEL_DIR
+from recommendation_index import RecommendationIndex
+from cooccurrence import CooccurrenceStore
+from microbatch import MicroBatcher
+from workers import AnalyticsPool
+from response_cache import ResponseCache
+from serialization import FastJSONProvider, compress, render
+from query import QueryError, date_param, float_param, int_param, page_params, paginate_frame, paginate_records
+from concurrent.futures import TimeoutError as AnalyticsTimeout
+import logging
+import os
+import threading
+import time
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+# Analytics engines are imported on first use (or by the pre-warm thread below)
+ComprehensiveRecommendationModel = LazyEngine('model')
+AdvancedCustomerAnalytics = LazyEngine('customer')
+ExpiryManagementSystem = LazyEngine('discount')
+SupplierAnalysis = LazyEngine('supplier')
+ExpiryIndex = LazyEngine('expiry_index', 'ExpiryIndex')
+FraudDetection = LazyEngine('fraud_detection')
+aggregate_vendor_features = LazyEngine('customer', 'aggregate_vendor_features')
+
+# Compute the RFM/churn vendor aggregates with MongoDB $group instead of pandas
+AGGREGATION_PUSHDOWN = os.environ.get('IMS_AGGREGATION_PUSHDOWN', '0') == '1'
 
 app = Flask(__name__)
-CORS(app)
-app.json_encoder = JSONEncoder
+# Let the frontend read the paging total and the cache validator
+CORS(app, expose_headers=['X-Total-Count', 'ETag'])
+# ObjectIds, NumPy values and pandas objects serialize directly, large bodies are compressed
+app.json = FastJSONProvider(app)
+app.after_request(compress)
 
-# MongoDB Connection
-client = MongoClient('mongodb://localhost:27017/')
+# MongoDB Connection, established on the first query rather than at import
+client = MongoClient('mongodb://localhost:27017/', connect=False)
 db = client['ims']
 bills_collection = db['bills']
 products_collection = db['products']
 market_demand_collection = db['market_demand']
 suppliers_collection = db['supplier']
 
+# Shared in-memory copy of bills/products/market_demand
+snapshot = DataSnapshot(db)
+snapshot.start_watcher()
+
+# Heavy analytics run on a bounded pool, concurrent identical requests share one run.
+# Requests give up after IMS_ANALYTICS_TIMEOUT seconds while the computation carries on.
+analytics_pool = AnalyticsPool(int(os.environ.get('IMS_ANALYTICS_WORKERS', os.cpu_count() or 4)))
+ANALYTICS_TIMEOUT = float(os.environ.get('IMS_ANALYTICS_TIMEOUT', '60'))
+
+
+def run_analytics(key, compute):
+    return analytics_pool.run(key, compute, timeout=ANALYTICS_TIMEOUT)
+
+
+# Latest full result of each analysis, so paged and filtered queries slice it
+# instead of recomputing it
+_latest_results = {}
+
+
+def latest_result(name, version, compute):
+    cached = _latest_results.get(name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    result = run_analytics((name, version), compute)
+    _latest_results[name] = (version, result)
+    return result
+
+
+def total_count(total):
+    # Size of the filtered result before paging
+    return {'X-Total-Count': str(total)}
+
+
+def train_demand_model(data):
+    recommender = ComprehensiveRecommendationModel(data.bills, data.products, data.market_demand)
+    return recommender.train_demand_model()
+
+
+# Fitted models are trained in the background and persisted to disk
+registry = ModelRegistry(snapshot)
+registry.register('demand', train_demand_model)
+registry.register('churn', lambda data: customer_analytics_for(data).train_churn_model())
+registry.start()
+
+
+def model_version(name):
+    info = registry.info(name)
+    return info['version'] if info else None
+
+
+# Rendered GET responses, reused while the data fingerprint (bill count and last
+# _id, products and market demand content) is unchanged. Set IMS_RESPONSE_CACHE_DIR
+# to keep them on disk across restarts.
+response_cache = ResponseCache(
+    lambda: registry.fingerprint(snapshot.get()),
+    max_entries=int(os.environ.get('IMS_RESPONSE_CACHE_SIZE', '256')),
+    ttl=float(os.environ['IMS_RESPONSE_CACHE_TTL']) if os.environ.get('IMS_RESPONSE_CACHE_TTL') else None,
+    path=os.environ.get('IMS_RESPONSE_CACHE_DIR')
+)
+
+# Materialized per-SKU recommendations shared by the inventory routes, replaced
+# by a freshly built index rather than updated under readers
+recommendation_index = None
+_index_lock = threading.Lock()
+
+
+def get_recommendation_index():
+    global recommendation_index
+    data = snapshot.get()
+    # Model and version from one entry, a retrain finishing meanwhile cannot mislabel the index
+    demand_entry = registry.get_entry('demand', data)
+
+    # Rebuilt only when the data snapshot or the served demand model changes
+    key = (data.version, demand_entry['version'])
+    index = recommendation_index
+    if index is not None and index.key == key:
+        return index
+    with _index_lock:
+        if recommendation_index is None or recommendation_index.key != key:
+            recommender = ComprehensiveRecommendationModel(data.bills, data.products, data.market_demand)
+            recommendations = recommender.generate_comprehensive_recommendations(demand_entry['model'])
+            recommendation_index = RecommendationIndex(recommendations, key)
+        return recommendation_index
+
+
+# Customer analytics of the current snapshot, so vendor features are built once per version
+_customer_analytics = (None, None)
+
+
+def customer_analytics_for(data):
+    """Customer analytics for a snapshot, from database-side aggregates if enabled"""
+    global _customer_analytics
+    if AGGREGATION_PUSHDOWN:
+        return AdvancedCustomerAnalytics(vendor_aggregates=aggregate_vendor_features(bills_collection))
+
+    version, customer_analytics = _customer_analytics
+    if version != data.version:
+        customer_analytics = AdvancedCustomerAnalytics(data.bills.copy())
+        _customer_analytics = (data.version, customer_analytics)
+    return customer_analytics
+
+
+# Supplier models are cached on the instance until the supplier data changes
+supplier_analytics = None
+
+# Products bucketed by expiry day, synced with the snapshot as products change
+expiry_index = None
+
+# Fraud models, loaded from disk (or fitted) on first use and then warm-started
+# on new bills in the background
+fraud_detection = None
+FRAUD_MODEL_PATH = os.path.join(DEFAULT_MODEL_DIR, 'fraud.joblib')
+FRAUD_REFRESH_INTERVAL = int(os.environ.get('IMS_FRAUD_REFRESH_INTERVAL', '300'))
+_fraud_lock = threading.Lock()
+
+# Concurrent fraud scoring requests are scored together in micro-batches
+fraud_batcher = MicroBatcher(
+    lambda bills: get_fraud_detection().score_bills(bills),
+    max_batch=int(os.environ.get('IMS_FRAUD_BATCH_SIZE', '512')),
+    max_wait_ms=float(os.environ.get('IMS_FRAUD_BATCH_WAIT_MS', '10'))
+)
+
+# Bundle co-occurrence counts, updated incrementally as new bills arrive
+cooccurrence = None
+_lazy_lock = threading.Lock()
+
+
+def get_supplier_analytics():
+    global supplier_analytics
+    with _lazy_lock:
+        if supplier_analytics is None:
+            supplier_analytics = SupplierAnalysis()
+    return supplier_analytics
+
+
+def get_expiry_index():
+    global expiry_index
+    data = snapshot.get()
+    with _lazy_lock:
+        if expiry_index is None:
+            expiry_index = ExpiryIndex()
+    return expiry_index.refresh(data.version, data.products)
+
+
+def get_fraud_detection():
+    global fraud_detection
+    # Own lock, the first fit can take a while and must not block the other lazy engines
+    with _fraud_lock:
+        if fraud_detection is None:
+            data = snapshot.get()
+            detector = FraudDetection.load(FRAUD_MODEL_PATH, data.products)
+            # Only bills past the saved watermark are trained on
+            try:
+                detector.sync(data.bills, data.products)
+            except Exception:
+                if not detector.fitted:
+                    raise
+                # Serve the models loaded from disk, the refresh thread retries the sync
+                logger.exception('Fraud model sync failed, serving the saved models')
+            fraud_detection = detector
+            threading.Thread(target=refresh_fraud_detection, name='fraud-refresh', daemon=True).start()
+    return fraud_detection
+
+
+def refresh_fraud_detection():
+    while True:
+        time.sleep(FRAUD_REFRESH_INTERVAL)
+        try:
+            data = snapshot.get()
+            fraud_detection.sync(data.bills, data.products)
+        except Exception:
+            # Keep the thread alive, the next interval retries
+            logger.exception('Fraud model refresh failed')
+
+
+def get_cooccurrence():
+    global cooccurrence
+    with _lazy_lock:
+        if cooccurrence is None:
+            cooccurrence = CooccurrenceStore.load(os.path.join(DEFAULT_MODEL_DIR, 'cooccurrence.joblib'))
+    return cooccurrence
+
+
+def sync_cooccurrence(data):
+    # Once per snapshot version, however many requests arrive meanwhile
+    cooccurrence = get_cooccurrence()
+    run_analytics(('cooccurrence-sync', data.version), lambda: cooccurrence.sync(data.bills))
+    return cooccurrence
+
+
+def warm_cooccurrence():
+    try:
+        sync_cooccurrence(snapshot.get())
+    except Exception:
+        # The first /product-bundles request retries
+        logger.exception('Co-occurrence warm-up failed')
+
+
+# Import the engines and fold the bill history into the bundle counts in the
+# background so the first requests do not pay for it
+if os.environ.get('IMS_PREWARM', '1') != '0':
+    prewarm()
+    threading.Thread(target=warm_cooccurrence, name='cooccurrence-warm', daemon=True).start()
+
+
+@app.errorhandler(AnalyticsTimeout)
+def analytics_timeout(e):
+    # The computation keeps running, a retry joins it
+    return jsonify({"error": "Analytics still running, retry shortly"}), 503, {'Retry-After': '5'}
+
+@app.errorhandler(QueryError)
+def invalid_query(e):
+    return jsonify({"error": str(e)}), 400
+
+INVENTORY_SORT_FIELDS = ('predicted_demand', 'recommended_stock', 'current_stock', 'market_demand_score', 'price')
+BUNDLE_SORT_FIELDS = ('confidence', 'support', 'bundle_price')
+RFM_SORT_FIELDS = ('rfm_score', 'recency', 'frequency', 'monetary')
+DISCOUNT_SORT_FIELDS = ('risk_score', 'suggested_discount', 'days_until_expiry', 'current_stock', 'current_price')
+
 @app.route('/inventory-recommendations', methods=['GET'])
+@response_cache.cached(lambda: model_version('demand'))
 def get_inventory_recommendations():
-    # Fetch data from MongoDB
-    bills_data = list(bills_collection.find())
-    products_data = list(products_collection.find())
-    market_demand_data = list(market_demand_collection.find())
+    # Paged with ?limit=&offset=, filtered by ?category= and ?risk_level=,
+    # ?sort= selects the top rows by a numeric field instead of risk level order
+    offset, limit, sort, descending = page_params(request.args, INVENTORY_SORT_FIELDS)
     
-    # Initialize and run recommendation model
-    recommender = ComprehensiveRecommendationModel(bills_data, products_data, market_demand_data)
-    inventory_recs = recommender.generate_comprehensive_recommendations()
+    # Read the precomputed recommendations, built off-thread when out of date
+    index = run_analytics(('recommendation-index',), get_recommendation_index)
+    inventory_recs = index.query(request.args.get('category'), request.args.get('risk_level'))
+    inventory_recs, total = paginate_records(inventory_recs, offset, limit, sort, descending)
     
-    return jsonify(inventory_recs)
+    return render(inventory_recs, headers=total_count(total))
 
 @app.route('/product-bundles', methods=['GET'])
+@response_cache.cached()
 def get_product_bundles():
-    # Fetch data from MongoDB
-    bills_data = list(bills_collection.find())
-    products_data = list(products_collection.find())
-    market_demand_data = list(market_demand_collection.find())
+    # Paged with ?limit=&offset=, top bundles by confidence unless ?sort= names another field
+    offset, limit, sort, descending = page_params(request.args, BUNDLE_SORT_FIELDS)
+    min_confidence = float_param(request.args, 'min_confidence', 0.3)
     
-    # Initialize and run recommendation model
-    recommender = ComprehensiveRecommendationModel(bills_data, products_data, market_demand_data)
-    bundle_recs = recommender.recommend_product_bundles()
+    # Fetch data from the shared snapshot
+    data = snapshot.get()
     
-    return jsonify(bundle_recs)
+    # Fold any new bills into the co-occurrence counts
+    cooccurrence = sync_cooccurrence(data)
+    products = data.products.drop_duplicates('sku')
+    product_details = dict(zip(products['sku'], zip(products['name'], products['price'])))
+    
+    # Read bundles from the current counts, optionally only those containing a given SKU
+    bundle_recs = cooccurrence.bundles(
+        product_details, min_confidence=min_confidence, sku=request.args.get('sku'), ordered=False
+    )
+    bundle_recs, total = paginate_records(bundle_recs, offset, limit, sort or 'confidence', descending)
+    
+    return jsonify(bundle_recs), 200, total_count(total)
 
 @app.route('/product-recommendation/<sku>', methods=['GET'])
+@response_cache.cached(lambda: model_version('demand'))
 def get_product_recommendation(sku):
-    # Fetch data from MongoDB
-    bills_data = list(bills_collection.find())
-    products_data = list(products_collection.find())
-    market_demand_data = list(market_demand_collection.find())
-    
-    # Initialize recommendation model
-    recommender = ComprehensiveRecommendationModel(bills_data, products_data, market_demand_data)
-    
-    # Get recommendation for specific product
-    product_rec = recommender.get_product_recommendation(sku)
+    # Look up the precomputed recommendation for the product
+    product_rec = run_analytics(('recommendation-index',), get_recommendation_index).get_with_similar(sku)
     
     if product_rec:
         return jsonify(product_rec)
@@ -72,17 +316,10 @@ def get_product_recommendation(sku):
         return jsonify({"error": "Product not found"}), 404
 
 @app.route('/monthly-predictions/<sku>', methods=['GET'])
+@response_cache.cached(lambda: model_version('demand'))
 def get_monthly_predictions(sku):
-    # Fetch data from MongoDB
-    bills_data = list(bills_collection.find())
-    products_data = list(products_collection.find())
-    market_demand_data = list(market_demand_collection.find())
-    
-    # Initialize recommendation model
-    recommender = ComprehensiveRecommendationModel(bills_data, products_data, market_demand_data)
-    
-    # Get recommendation for specific product
-    product_rec = recommender.get_product_recommendation(sku)
+    # Look up the precomputed recommendation for the product
+    product_rec = run_analytics(('recommendation-index',), get_recommendation_index).get(sku)
     
     if product_rec and 'monthly_predictions' in product_rec:
         return jsonify(product_rec['monthly_predictions'])
@@ -90,17 +327,10 @@ def get_monthly_predictions(sku):
         return jsonify({"error": "Monthly predictions not found"}), 404
 
 @app.route('/yearly-trend/<sku>', methods=['GET'])
+@response_cache.cached(lambda: model_version('demand'))
 def get_yearly_trend(sku):
-    # Fetch data from MongoDB
-    bills_data = list(bills_collection.find())
-    products_data = list(products_collection.find())
-    market_demand_data = list(market_demand_collection.find())
-    
-    # Initialize recommendation model
-    recommender = ComprehensiveRecommendationModel(bills_data, products_data, market_demand_data)
-    
-    # Get recommendation for specific product
-    product_rec = recommender.get_product_recommendation(sku)
+    # Look up the precomputed recommendation for the product
+    product_rec = run_analytics(('recommendation-index',), get_recommendation_index).get(sku)
     
     if product_rec and 'yearly_trend' in product_rec:
         return jsonify(product_rec['yearly_trend'])
@@ -108,94 +338,225 @@ def get_yearly_trend(sku):
         return jsonify({"error": "Yearly trend not found"}), 404
 
 @app.route('/customer-insights', methods=['GET'])
+@response_cache.cached()
 def get_customer_insights():
-    # Fetch bills data from MongoDB
-    bills_data = list(bills_collection.find())
+    # Fetch bills data from the shared snapshot
+    data = snapshot.get()
+    
+    def compute():
+        # Initialize customer analytics
+        customer_analytics = AdvancedCustomerAnalytics(data.bills.copy())
+        return customer_analytics.generate_customer_insights()
     
-    # Initialize customer analytics
-    customer_analytics = AdvancedCustomerAnalytics(pd.DataFrame(bills_data))
-    insights = customer_analytics.generate_customer_insights()
+    insights = run_analytics(('customer-insights', data.version), compute)
     
-    return jsonify(insights)
+    # The fitted churn classifier itself is not part of the response
+    churn_analysis = {key: value for key, value in insights['churn_analysis'].items() if key != 'model'}
+    return render(dict(insights, churn_analysis=churn_analysis))
 
 @app.route('/customer-segments', methods=['GET'])
+@response_cache.cached()
 def get_customer_segments():
-    # Fetch bills data from MongoDB
-    bills_data = list(bills_collection.find())
+    # Fetch bills data from the shared snapshot
+    data = snapshot.get()
+    # Fast cluster-count selection unless ?fast=0
+    fast = request.args.get('fast', '1') != '0'
+    segment = int_param(request.args, 'segment')
     
-    # Initialize customer analytics
-    customer_analytics = AdvancedCustomerAnalytics(pd.DataFrame(bills_data))
-    segmentation, profiles = customer_analytics.perform_customer_segmentation()
+    def compute():
+        # Initialize customer analytics
+        customer_analytics = AdvancedCustomerAnalytics(data.bills.copy())
+        return customer_analytics.perform_customer_segmentation(fast=fast)
     
-    return jsonify({
-        'segments': segmentation.to_dict(),
-        'profiles': profiles.to_dict()
-    })
+    segmentation, profiles = latest_result(('customer-segments', fast), data.version, compute)
+    
+    # Vendors of one cluster with ?segment=, paged and sorted by any feature column
+    offset, limit, sort, descending = page_params(request.args, tuple(segmentation.columns))
+    if segment is not None:
+        segmentation = segmentation[segmentation['Cluster'] == segment]
+        profiles = profiles[[f'Cluster_{segment}']] if f'Cluster_{segment}' in profiles else profiles.iloc[:, :0]
+    segmentation, total = paginate_frame(segmentation, offset, limit, sort, descending)
+    
+    return render({
+        'segments': segmentation,
+        'profiles': profiles
+    }, table=segmentation, headers=total_count(total))
 
 @app.route('/rfm-analysis', methods=['GET'])
+@response_cache.cached()
 def get_rfm_analysis():
-    # Fetch bills data from MongoDB
-    bills_data = list(bills_collection.find())
+    # Vendors of one ?segment= (Low, Medium, High), paged and top-K by ?sort=
+    offset, limit, sort, descending = page_params(request.args, RFM_SORT_FIELDS)
+    data = snapshot.get()
     
-    # Initialize customer analytics
-    customer_analytics = AdvancedCustomerAnalytics(pd.DataFrame(bills_data))
-    rfm = customer_analytics.perform_rfm_analysis()
+    def compute():
+        # Initialize customer analytics, from database-side aggregates if enabled
+        if AGGREGATION_PUSHDOWN:
+            customer_analytics = AdvancedCustomerAnalytics(
+                vendor_aggregates=aggregate_vendor_features(bills_collection)
+            )
+        else:
+            customer_analytics = AdvancedCustomerAnalytics(data.bills.copy())
+        
+        rfm = customer_analytics.perform_rfm_analysis()
+        return rfm[['rfm_score', 'recency', 'frequency', 'monetary', 'value_segment']]
     
-    return jsonify({
-        'rfm_score': rfm['rfm_score'].to_dict(),
-        'recency': rfm['recency'].to_dict(),
-        'frequency': rfm['frequency'].to_dict(),
-        'monetary': rfm['monetary'].to_dict(),
-        'value_segment': rfm['value_segment'].to_dict()
-    })
+    rfm = latest_result('rfm-analysis', data.version, compute)
+    
+    segment = request.args.get('segment')
+    if segment is not None:
+        rfm = rfm[rfm['value_segment'] == segment]
+    rfm, total = paginate_frame(rfm, offset, limit, sort, descending)
+    
+    return render({column: rfm[column] for column in rfm.columns}, table=rfm, headers=total_count(total))
 
 @app.route('/supplier-analysis', methods=['GET'])
 def get_supplier_analysis():
-    # Fetch supplier data from MongoDB
-    supplier_data = list(suppliers_collection.find())
-    
-    # Initialize supplier analytics
-    supplier_analytics = SupplierAnalysis()
-    analysis_results = supplier_analytics.analyze_suppliers(pd.DataFrame(supplier_data))
+    def compute():
+        # Fetch supplier data from MongoDB
+        supplier_data = load_suppliers(suppliers_collection)
+        
+        # Shared supplier analytics keeps its fitted models between requests
+        analysis_results = get_supplier_analytics().analyze_suppliers(supplier_data)
+        return {
+            'supplier_metrics': analysis_results['supplier_metrics'].to_dict(),
+            'stock_rmse': float(analysis_results['stock_rmse']),
+            'performance_distribution': analysis_results['performance_distribution'].to_dict(),
+            'model_accuracy': float(analysis_results['model_accuracy'])
+        }
     
-    return jsonify({
-        'supplier_metrics': analysis_results['supplier_metrics'].to_dict(),
-        'stock_rmse': float(analysis_results['stock_rmse']),
-        'performance_distribution': analysis_results['performance_distribution'].to_dict(),
-        'model_accuracy': float(analysis_results['model_accuracy'])
-    })
+    return jsonify(run_analytics(('supplier-analysis',), compute))
 
 @app.route('/churn-prediction', methods=['GET'])
+@response_cache.cached(lambda: model_version('churn'))
 def get_churn_prediction():
-    # Fetch bills data from MongoDB
-    bills_data = list(bills_collection.find())
+    data = snapshot.get()
     
-    # Initialize customer analytics
-    customer_analytics = AdvancedCustomerAnalytics(pd.DataFrame(bills_data))
-    churn_analysis = customer_analytics.predict_churn()
+    def compute():
+        # Score every vendor with the stored churn model
+        churn_model = registry.get('churn', data)
+        customer_analytics = customer_analytics_for(data)
+        churn_probabilities = customer_analytics.score_churn(churn_model, n_jobs=-1)
+        return churn_model, churn_probabilities
     
-    return jsonify({
-        'feature_importance': churn_analysis['feature_importance'].to_dict(),
-        'churn_probabilities': churn_analysis['churn_probabilities'].to_dict(),
+    churn_model, churn_probabilities = run_analytics(('churn-prediction', data.version), compute)
+    
+    return render({
+        'feature_importance': churn_model['feature_importance'],
+        'churn_probabilities': churn_probabilities,
         'metrics': {
-            'auc_score': float(churn_analysis['auc_score']),
-            'precision': float(churn_analysis['precision']), 
-            'recall': float(churn_analysis['recall'])
+            'auc_score': float(churn_model['auc_score']),
+            'precision': float(churn_model['precision']), 
+            'recall': float(churn_model['recall'])
         }
-    })
+    }, table=churn_probabilities.rename('churn_probability'))
+
+@app.route('/churn-scores', methods=['GET', 'POST'])
+@response_cache.cached(lambda: model_version('churn'))
+def get_churn_scores():
+    # Vendors from ?vendor=a&vendor=b or a JSON body {"vendorNames": [...]}, all if none given
+    if request.method == 'POST':
+        payload = request.get_json(silent=True) or {}
+        vendor_names = payload.get('vendorNames') if isinstance(payload, dict) else payload
+        if vendor_names is not None and not (
+                isinstance(vendor_names, list) and all(isinstance(name, str) for name in vendor_names)):
+            return jsonify({"error": "vendorNames must be a list of vendor names"}), 400
+    else:
+        vendor_names = request.args.getlist('vendor') or None
+    
+    data = snapshot.get()
+    
+    def compute():
+        # A cold registry trains the churn model first
+        churn_model = registry.get('churn', data)
+        customer_analytics = customer_analytics_for(data)
+        return customer_analytics.score_churn(churn_model, vendor_names, n_jobs=-1)
+    
+    vendor_key = tuple(vendor_names) if vendor_names is not None else None
+    churn_probabilities = run_analytics(('churn-scores', data.version, vendor_key), compute)
+    
+    unknown_vendors = []
+    if vendor_names is not None:
+        unknown_vendors = [name for name in vendor_names if name not in churn_probabilities.index]
+    
+    return render({
+        'churn_probabilities': churn_probabilities,
+        'unknown_vendors': unknown_vendors,
+        'model': registry.info('churn')
+    }, table=churn_probabilities.rename('churn_probability'))
 
 @app.route('/discount-recommendations', methods=['GET'])
+@response_cache.cached(lambda: date.today())
 def get_discount_recommendations():
-    # Fetch products data from MongoDB
-    products_data = list(products_collection.find())
+    # Recommendations paged with ?limit=&offset=, filtered by ?category=, top-K by ?sort=
+    offset, limit, sort, descending = page_params(request.args, DISCOUNT_SORT_FIELDS)
+    
+    # Fetch products data from the shared snapshot
+    data = snapshot.get()
+    
+    def compute():
+        # Initialize expiry management system
+        expiry_system = ExpiryManagementSystem(data.products.copy())
+        
+        # Generate discount report
+        return expiry_system.generate_report()
+    
+    discount_report = latest_result('discount-recommendations', (data.version, date.today()), compute)
+    
+    recommendations = discount_report['recommendations']
+    category = request.args.get('category')
+    if category is not None:
+        recommendations = [rec for rec in recommendations if rec['category'] == category]
+    recommendations, total = paginate_records(recommendations, offset, limit, sort, descending)
+    
+    return render(dict(discount_report, recommendations=recommendations), headers=total_count(total))
+
+@app.route('/expiry-tier-changes', methods=['GET'])
+@response_cache.cached(lambda: date.today())
+def get_expiry_tier_changes():
+    # Products entering a new discount tier on ?date= (today by default)
+    recommendations = get_expiry_index().crossing_tiers(date_param(request.args, 'date'))
+    
+    return jsonify(recommendations)
+
+@app.route('/fraud-score', methods=['POST'])
+def score_fraud():
+    # One bill record {"sku": ..., "quantity": ..., "total_amount": ...} or a list of them
+    payload = request.get_json(silent=True)
+    if isinstance(payload, list):
+        return jsonify(fraud_batcher.score(payload))
+    if not isinstance(payload, dict):
+        return jsonify({"error": "Expected a bill record or a list of bill records"}), 400
     
-    # Initialize expiry management system
-    expiry_system = ExpiryManagementSystem(products_data)
+    result = fraud_batcher.score([payload])[0]
+    if 'error' in result:
+        unknown_sku = result['error'] == load('fraud_detection').UNKNOWN_SKU_ERROR
+        return jsonify(result), 404 if unknown_sku else 400
     
-    # Generate discount report
-    discount_report = expiry_system.generate_report()
+    return jsonify(result)
+
+@app.route('/fraud-anomalies', methods=['GET'])
+def get_fraud_anomalies():
+    # Historical anomalies, paginated with ?limit= (100 by default) and ?offset=
+    offset, limit, _, _ = page_params(request.args)
+    if limit is None:
+        limit = 100
+    detector = get_fraud_detection()
     
-    return jsonify(discount_report)
+    return jsonify({
+        'total': len(detector.anomalies),
+        'anomalies': detector.get_all_anomalies(limit, offset)
+    })
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # The snapshot watcher, model registry and pre-warm threads start at import, and
+    # the debug reloader would run them (and their retraining) in a second process,
+    # so it stays off and debug mode is opt-in with IMS_DEBUG=1. For production
+    # use a single-process WSGI server, e.g. waitress-serve --port=5000 app:app
+    app.run(
+        host=os.environ.get('IMS_HOST', '127.0.0.1'),
+        port=int(os.environ.get('IMS_PORT', '5000')),
+        debug=os.environ.get('IMS_DEBUG', '0') == '1',
+        use_reloader=False,
+        threaded=True
+    )
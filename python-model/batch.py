@@ -0,0 +1,138 @@
+"""Partitioned batch run of the discount report and inventory recommendations.
+
+Products are split by a partition key (category by default) together with the
+bills of their SKUs, and each partition is processed in its own worker process:
+
+    python batch.py --partition-key category --workers 8 --output batch.json
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from pymongo import MongoClient
+
+from discount import ExpiryManagementSystem
+from loader import load_bills, load_market_demand, load_products
+from model import ComprehensiveRecommendationModel
+
+# Shared by every task of a worker process, set once by _init_worker
+_worker_state = {}
+
+
+def partition(products, bills, key='category'):
+    """Yield (value, products, bills) per value of the product partition key"""
+    products = products.reset_index(drop=True)
+    codes, values = pd.factorize(products[key], use_na_sentinel=False)
+
+    # Bills follow their product's partition, bills of unknown SKUs are dropped
+    sku_codes = pd.Series(codes, index=products['sku']).groupby(level=0).first()
+    bill_codes = sku_codes.reindex(bills['productSku'].astype(object)).to_numpy()
+    bill_groups = pd.Series(range(len(bills))).groupby(bill_codes).indices
+
+    for code, product_rows in pd.Series(range(len(products))).groupby(codes).indices.items():
+        yield values[code], products.iloc[product_rows], bills.iloc[bill_groups.get(code, [])]
+
+
+def catalogue_maxima(products, today):
+    """Catalogue-wide maxima the discount risk score is normalized by"""
+    days_until_expiry = (pd.to_datetime(products['expiry_date']) - today).dt.days
+    return {
+        'days_until_expiry': days_until_expiry.max(),
+        'stock_ratio': (products['stock'] / products['lowStockThreshold']).max(),
+        'price': products['price'].max()
+    }
+
+
+def _init_worker(market_demand, demand_model, today, maxima):
+    _worker_state.update(market_demand=market_demand, demand_model=demand_model, today=today, maxima=maxima)
+
+
+def _run_partition(products, bills):
+    expiry_system = ExpiryManagementSystem(products.copy(), _worker_state['today'], _worker_state['maxima'])
+    discount_report = expiry_system.generate_report()
+
+    # Products without bills get no recommendation, as in a global run
+    recommendations = []
+    if not bills.empty:
+        recommender = ComprehensiveRecommendationModel(bills, products, _worker_state['market_demand'])
+        recommendations = recommender.generate_comprehensive_recommendations(_worker_state['demand_model'])
+
+    return discount_report, recommendations
+
+
+def merge_reports(reports):
+    """Combine per-partition discount reports into one"""
+    merged = {
+        'summary': {'total_products': 0, 'high_risk_products': 0, 'total_inventory_value': 0.0, 'at_risk_value': 0.0},
+        'recommendations': []
+    }
+    for report in reports:
+        for field, value in report['summary'].items():
+            merged['summary'][field] += value
+        merged['recommendations'] += report['recommendations']
+    merged['summary']['total_inventory_value'] = float(merged['summary']['total_inventory_value'])
+    merged['summary']['at_risk_value'] = float(merged['summary']['at_risk_value'])
+    return merged
+
+
+def run(bills, products, market_demand, key='category', max_workers=None, demand_model=None, today=None):
+    """Run the discount report and recommendations per partition and merge the results"""
+    today = pd.Timestamp(today).normalize() if today is not None else pd.Timestamp.now().normalize()
+
+    # Anything that needs the whole catalogue is computed once up front
+    if demand_model is None:
+        demand_model = ComprehensiveRecommendationModel(bills, products, market_demand).train_demand_model()
+    maxima = catalogue_maxima(products, today)
+
+    partitions = {}
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(market_demand, demand_model, today, maxima)
+    ) as executor:
+        futures = {
+            value: executor.submit(_run_partition, partition_products, partition_bills)
+            for value, partition_products, partition_bills in partition(products, bills, key)
+        }
+        for value, future in futures.items():
+            partitions[value] = future.result()
+
+    recommendations = [rec for _, partition_recs in partitions.values() for rec in partition_recs]
+    return {
+        'partitions': {
+            str(value): {'discount_report': report, 'recommendations': recs}
+            for value, (report, recs) in partitions.items()
+        },
+        'discount_report': merge_reports(report for report, _ in partitions.values()),
+        'recommendations': sorted(recommendations, key=lambda x: x['risk_level'], reverse=True)
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Partitioned discount and recommendation batch run')
+    parser.add_argument('--partition-key', default='category', help='product field to partition by')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/')
+    parser.add_argument('--output', help='write the merged results here as JSON (default: print a summary)')
+    args = parser.parse_args()
+
+    db = MongoClient(args.mongo_uri)['ims']
+    start = time.perf_counter()
+    results = run(
+        load_bills(db['bills'], 'recommendation'),
+        load_products(db['products']),
+        load_market_demand(db['market_demand']),
+        key=args.partition_key,
+        max_workers=args.workers
+    )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, default=str)
+    print(f"{len(results['partitions'])} partitions, "
+          f"{len(results['recommendations'])} recommendations, "
+          f"{results['discount_report']['summary']['high_risk_products']} high-risk products "
+          f"in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,103 @@
+"""Benchmark the customer analytics aggregation kernels on synthetic bills.
+
+Compares the per-group Python lambdas the RFM and segmentation code used to
+run inside groupby.agg with the vectorized versions, plus the full RFM and
+vendor feature table, at several bill counts:
+
+    python benchmark.py --sizes 10000 100000 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from customer import AdvancedCustomerAnalytics
+
+
+def synthetic_bills(n_bills, n_vendors=None, n_products=500, seed=42):
+    """Random bill lines with the columns AdvancedCustomerAnalytics expects"""
+    rng = np.random.default_rng(seed)
+    n_vendors = n_vendors or max(10, n_bills // 200)
+    quantity = rng.integers(1, 20, n_bills)
+    vendors = rng.integers(0, n_vendors, n_bills)
+    # Each vendor stops buying at a different point so recency varies
+    last_day = rng.integers(0, 365, n_vendors)[vendors]
+    days = np.maximum(0, last_day - rng.exponential(60, n_bills).astype(int))
+    return pd.DataFrame({
+        'billNumber': rng.integers(0, max(1, n_bills // 3), n_bills).astype(str),
+        'productSku': pd.Categorical(rng.integers(0, n_products, n_bills).astype(str)),
+        'quantity': quantity,
+        'totalAmount': quantity * rng.uniform(1, 100, n_bills),
+        'vendorName': pd.Categorical(vendors.astype(str)),
+        'paymentType': pd.Categorical(rng.choice(['Due', 'Paid'], n_bills)),
+        'Date': pd.Timestamp('2025-01-01') + pd.to_timedelta(days, unit='D')
+    })
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def lambda_recency(df):
+    current_date = df['Date'].max()
+    return df.groupby('vendorName', observed=True)['Date'].agg(lambda x: (current_date - x.max()).days)
+
+
+def vectorized_recency(df):
+    current_date = df['Date'].max()
+    return (current_date - df.groupby('vendorName', observed=True)['Date'].max()).dt.days
+
+
+def lambda_due_ratio(df):
+    return df.groupby('vendorName', observed=True)['paymentType'].agg(lambda x: (x == 'Due').mean())
+
+
+def vectorized_due_ratio(df):
+    return df['isDue'].groupby(df['vendorName'], observed=True).mean()
+
+
+def run(sizes, repeat):
+    rows = []
+    for size in sizes:
+        analytics = AdvancedCustomerAnalytics(synthetic_bills(size))
+        df = analytics.df
+
+        # Both kernels must agree before their timings mean anything
+        pd.testing.assert_series_equal(lambda_recency(df), vectorized_recency(df), check_names=False)
+        pd.testing.assert_series_equal(lambda_due_ratio(df), vectorized_due_ratio(df), check_names=False)
+
+        def feature_table():
+            analytics._vendor_features = None
+            analytics.vendor_features()
+
+        def rfm():
+            analytics._vendor_features = None
+            analytics.perform_rfm_analysis()
+
+        rows.append({
+            'bills': size,
+            'vendors': df['vendorName'].nunique(),
+            'recency_lambda': timed(lambda: lambda_recency(df), repeat),
+            'recency_vectorized': timed(lambda: vectorized_recency(df), repeat),
+            'due_ratio_lambda': timed(lambda: lambda_due_ratio(df), repeat),
+            'due_ratio_vectorized': timed(lambda: vectorized_due_ratio(df), repeat),
+            'vendor_features': timed(feature_table, repeat),
+            'rfm_analysis': timed(rfm, repeat)
+        })
+    return pd.DataFrame(rows).set_index('bills')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark customer analytics aggregation kernels')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=3, help='best-of repetitions per kernel')
+    args = parser.parse_args()
+
+    with pd.option_context('display.float_format', '{:.4f}'.format, 'display.width', 200, 'display.max_columns', None):
+        print(run(args.sizes, args.repeat))
@@ -0,0 +1,240 @@
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from itertools import combinations
+
+import joblib
+import pandas as pd
+
+# Counters are rescaled once the newest basket is this many half-lives past the
+# reference time, so weights stay within a few orders of magnitude of 1
+RESCALE_HALF_LIVES = 16
+
+
+class CooccurrenceStore:
+    def __init__(self, half_life_days=None, window_days=None, path=None, save_interval=300):
+        """Item, pair and basket counts kept up to date as new bills arrive.
+
+        half_life_days weights each basket by 2 ** (age / half_life) relative to a
+        reference time. Support and confidence are ratios, so the common scale
+        cancels out and older baskets simply count for less.
+        window_days drops baskets older than the window entirely.
+        When a path is given the store is saved there at most every save_interval seconds.
+        """
+        self.half_life_days = half_life_days
+        self.window_days = window_days
+        self.path = path
+        self.save_interval = save_interval
+
+        self.item_counts = defaultdict(float)
+        self.pair_counts = defaultdict(lambda: defaultdict(float))
+        self.basket_count = 0.0
+        self.last_bill_id = None
+
+        self._baskets = {}
+        self._window = deque()
+        self._newest = None
+        self._reference_time = None
+        self._last_save = time.monotonic()
+        self._lock = threading.Lock()
+        # Serializes reading and advancing the watermark, so bills are folded in once
+        self._sync_lock = threading.Lock()
+
+    def sync(self, bills):
+        """Add every bill with an _id after the current watermark (bills sorted by _id)"""
+        if bills.empty:
+            return 0
+        with self._sync_lock:
+            start = 0
+            if self.last_bill_id is not None:
+                start = bills['_id'].searchsorted(self.last_bill_id, side='right')
+            new_bills = bills.iloc[start:]
+            if new_bills.empty:
+                return 0
+
+            self.add_bills(new_bills)
+            self.last_bill_id = new_bills['_id'].iloc[-1]
+
+            if self.path and time.monotonic() - self._last_save >= self.save_interval:
+                self.save(self.path)
+            return len(new_bills)
+
+    def add_bills(self, bills):
+        """Fold bill lines into the counters, grouping them into baskets by billNumber"""
+        if 'createdAt' in bills.columns:
+            created = pd.to_datetime(bills['createdAt']).fillna(pd.Timestamp(datetime.now()))
+        else:
+            created = pd.Series(pd.Timestamp(datetime.now()), index=bills.index)
+
+        grouped = pd.DataFrame({
+            'billNumber': bills['billNumber'].to_numpy(),
+            'productSku': bills['productSku'].to_numpy(),
+            'createdAt': created.to_numpy()
+        }).groupby('billNumber', sort=False).agg({'productSku': list, 'createdAt': 'min'})
+
+        with self._lock:
+            for bill_number, skus, created_at in zip(grouped.index, grouped['productSku'], grouped['createdAt']):
+                items = set(skus)
+                previous = self._baskets.get(bill_number)
+                if previous is not None:
+                    # Lines of an already counted bill, recount the merged basket
+                    self._apply(previous[0], -previous[1])
+                    items |= previous[0]
+                    created_at = min(created_at, previous[2])
+                else:
+                    self._window.append((created_at, bill_number))
+                    if self._newest is None or created_at > self._newest:
+                        self._newest = created_at
+
+                weight = self._weight(created_at)
+                self._baskets[bill_number] = (frozenset(items), weight, created_at)
+                self._apply(items, weight)
+
+            self._expire()
+
+    def bundles(self, product_details, min_support=0.01, min_confidence=0.3, sku=None, ordered=True):
+        """Bundle recommendations from the current counts, optionally only those containing sku.
+
+        ordered=False skips sorting by confidence, for callers that only select the top few.
+        """
+        with self._lock:
+            if not self.basket_count:
+                return []
+
+            if sku is not None:
+                pairs = ((sku, other, count) for other, count in self.pair_counts.get(sku, {}).items())
+            else:
+                pairs = (
+                    (prod1, prod2, count)
+                    for prod1, neighbours in self.pair_counts.items()
+                    for prod2, count in neighbours.items()
+                    if prod1 < prod2
+                )
+
+            bundles = []
+            for prod1, prod2, count in pairs:
+                if prod1 not in product_details or prod2 not in product_details:
+                    continue
+                support = count / self.basket_count
+                if support < min_support:
+                    continue
+                conf1 = count / self.item_counts[prod1]
+                conf2 = count / self.item_counts[prod2]
+                if conf1 >= min_confidence or conf2 >= min_confidence:
+                    name1, price1 = product_details[prod1]
+                    name2, price2 = product_details[prod2]
+                    bundles.append({
+                        'products': [
+                            {'sku': prod1, 'name': name1},
+                            {'sku': prod2, 'name': name2}
+                        ],
+                        'support': support,
+                        'confidence': max(conf1, conf2),
+                        'bundle_price': float(price1 + price2),
+                        'suggested_discount': 0.1  # 10% discount for bundles
+                    })
+
+        if not ordered:
+            return bundles
+        return sorted(bundles, key=lambda x: x['confidence'], reverse=True)
+
+    def save(self, path):
+        self._last_save = time.monotonic()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            state = {
+                'half_life_days': self.half_life_days,
+                'window_days': self.window_days,
+                'item_counts': dict(self.item_counts),
+                'pair_counts': {sku: dict(neighbours) for sku, neighbours in self.pair_counts.items()},
+                'basket_count': self.basket_count,
+                'last_bill_id': self.last_bill_id,
+                'baskets': self._baskets,
+                'window': list(self._window),
+                'newest': self._newest,
+                'reference_time': self._reference_time
+            }
+        tmp_path = path + '.tmp'
+        joblib.dump(state, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, half_life_days=None, window_days=None, save_interval=300):
+        """Load a saved store, or start empty if there is none or its settings differ"""
+        store = cls(half_life_days, window_days, path, save_interval)
+        if not os.path.exists(path):
+            return store
+        try:
+            state = joblib.load(path)
+        except Exception:
+            return store
+        if state['half_life_days'] != half_life_days or state['window_days'] != window_days:
+            return store
+
+        store.item_counts.update(state['item_counts'])
+        for sku, neighbours in state['pair_counts'].items():
+            store.pair_counts[sku].update(neighbours)
+        store.basket_count = state['basket_count']
+        store.last_bill_id = state['last_bill_id']
+        store._baskets = state['baskets']
+        store._window = deque(state['window'])
+        store._newest = state['newest']
+        store._reference_time = state['reference_time']
+        return store
+
+    def _weight(self, created_at):
+        if not self.half_life_days:
+            return 1.0
+        if self._reference_time is None:
+            self._reference_time = created_at
+        half_lives = (created_at - self._reference_time) / timedelta(days=self.half_life_days)
+        if half_lives > RESCALE_HALF_LIVES:
+            self._rescale(created_at, 2.0 ** -half_lives)
+            half_lives = 0.0
+        return 2.0 ** half_lives
+
+    def _rescale(self, reference_time, factor):
+        # Move the reference time forward and scale every stored weight to match,
+        # ratios (support, confidence) are unchanged
+        self._reference_time = reference_time
+        self.basket_count *= factor
+        for sku in self.item_counts:
+            self.item_counts[sku] *= factor
+        for neighbours in self.pair_counts.values():
+            for sku in neighbours:
+                neighbours[sku] *= factor
+        for bill_number, (items, weight, created_at) in self._baskets.items():
+            self._baskets[bill_number] = (items, weight * factor, created_at)
+
+    def _apply(self, items, weight):
+        self.basket_count += weight
+        for sku in items:
+            self.item_counts[sku] += weight
+        for prod1, prod2 in combinations(items, 2):
+            self.pair_counts[prod1][prod2] += weight
+            self.pair_counts[prod2][prod1] += weight
+
+        if weight < 0:
+            # Drop counters that went back to (floating point) zero
+            tolerance = -weight * 1e-9
+            for sku in items:
+                if self.item_counts[sku] <= tolerance:
+                    del self.item_counts[sku]
+            for prod1, prod2 in combinations(items, 2):
+                for a, b in ((prod1, prod2), (prod2, prod1)):
+                    if self.pair_counts[a][b] <= tolerance:
+                        del self.pair_counts[a][b]
+                        if not self.pair_counts[a]:
+                            del self.pair_counts[a]
+
+    def _expire(self):
+        if not self.window_days or not self._window:
+            return
+        # Bills can arrive slightly out of order, so the window is anchored on the newest one
+        cutoff = self._newest - timedelta(days=self.window_days)
+        while self._window and self._window[0][0] < cutoff:
+            _, bill_number = self._window.popleft()
+            items, weight, _ = self._baskets.pop(bill_number)
+            self._apply(items, -weight)
@@ -1,21 +1,130 @@
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.preprocessing import StandardScaler, MinMaxScaler
 from sklearn.decomposition import PCA
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import silhouette_score, roc_auc_score, precision_score, recall_score
-import matplotlib.pyplot as plt
-from mlxtend.frequent_patterns import apriori
+from mlxtend.frequent_patterns import apriori, fpgrowth
 from mlxtend.frequent_patterns import association_rules
+from itertools import combinations
+from scipy import sparse
 from datetime import datetime, timedelta
 from sklearn.linear_model import LogisticRegression
 
+# Columns of the vendor feature table used by each analysis, in their original order
+CHURN_FEATURES = [
+    'totalAmount_mean', 'totalAmount_sum', 'totalAmount_std',
+    'quantity_mean', 'quantity_sum', 'billNumber_count',
+    'itemsPerTransaction_mean', 'itemsPerTransaction_max', 'avgItemPrice_mean'
+]
+SEGMENTATION_FEATURES = [
+    'totalAmount_sum', 'totalAmount_mean', 'totalAmount_std',
+    'quantity_sum', 'quantity_mean', 'billNumber_count',
+    'isDue_mean', 'isWeekend_mean', 'itemsPerTransaction_mean',
+    'customerLifetimeValue_first'
+]
+PAYMENT_FEATURES = [
+    'totalAmount_mean', 'totalAmount_sum', 'totalAmount_std',
+    'quantity_mean', 'quantity_sum',
+    'itemsPerTransaction_mean', 'itemsPerTransaction_max',
+    'isWeekend_mean', 'customerLifetimeValue_first'
+]
+
+
+def aggregate_vendor_features(bills_collection, date_field='Date'):
+    """Compute per-vendor RFM/churn aggregates in MongoDB, transferring one row per vendor"""
+    pipeline = [
+        # Total quantity of the bill each line belongs to
+        {'$setWindowFields': {
+            'partitionBy': '$billNumber',
+            'output': {'itemsPerTransaction': {'$sum': '$quantity'}}
+        }},
+        {'$group': {
+            '_id': '$vendorName',
+            'last_date': {'$max': f'${date_field}'},
+            'totalAmount_mean': {'$avg': '$totalAmount'},
+            'totalAmount_sum': {'$sum': '$totalAmount'},
+            'totalAmount_std': {'$stdDevSamp': '$totalAmount'},
+            'quantity_mean': {'$avg': '$quantity'},
+            'quantity_sum': {'$sum': '$quantity'},
+            'billNumber_count': {'$sum': 1},
+            'itemsPerTransaction_mean': {'$avg': '$itemsPerTransaction'},
+            'itemsPerTransaction_max': {'$max': '$itemsPerTransaction'},
+            'avgItemPrice_mean': {'$avg': {'$cond': [
+                {'$eq': ['$quantity', 0]}, None, {'$divide': ['$totalAmount', '$quantity']}
+            ]}}
+        }}
+    ]
+    vendor_features = pd.DataFrame(list(bills_collection.aggregate(pipeline, allowDiskUse=True)))
+    if vendor_features.empty:
+        return pd.DataFrame(columns=['last_date'] + CHURN_FEATURES)
+
+    vendor_features = vendor_features.rename(columns={'_id': 'vendorName'}).set_index('vendorName')
+    vendor_features['last_date'] = pd.to_datetime(vendor_features['last_date'])
+    vendor_features[CHURN_FEATURES] = vendor_features[CHURN_FEATURES].astype(float).fillna(0)
+    return vendor_features[['last_date'] + CHURN_FEATURES]
+
+
+RULE_COLUMNS = [
+    'antecedents', 'consequents', 'antecedent support',
+    'consequent support', 'support', 'confidence', 'lift'
+]
+
+
+def stream_association_rules(frequent_itemsets, min_confidence=0.5, min_lift=1):
+    """Yield association rules one at a time, keeping only those passing both thresholds"""
+    support = dict(zip(frequent_itemsets['itemsets'], frequent_itemsets['support']))
+    
+    for itemset, itemset_support in support.items():
+        for size in range(1, len(itemset)):
+            for antecedent in combinations(itemset, size):
+                antecedent = frozenset(antecedent)
+                consequent = itemset - antecedent
+                # Every subset of a frequent itemset is frequent, so both supports are known
+                antecedent_support = support[antecedent]
+                consequent_support = support[consequent]
+                confidence = itemset_support / antecedent_support
+                lift = confidence / consequent_support
+                if confidence >= min_confidence and lift >= min_lift:
+                    yield (antecedent, consequent, antecedent_support,
+                           consequent_support, itemset_support, confidence, lift)
+
+
+class ClusterCountCache:
+    def __init__(self, max_shift=0.1):
+        """Remembers the chosen cluster count until the vendor set changes by more than max_shift"""
+        self.max_shift = max_shift
+        self._vendors = None
+        self._n_clusters = None
+
+    def get(self, vendors):
+        if self._vendors is None:
+            return None
+        vendors = set(vendors)
+        # Jaccard distance between the cached and current vendor populations
+        union = len(vendors | self._vendors)
+        shift = 1 - len(vendors & self._vendors) / union if union else 0
+        return self._n_clusters if shift <= self.max_shift else None
+
+    def set(self, vendors, n_clusters):
+        self._vendors = set(vendors)
+        self._n_clusters = n_clusters
+
+
+_cluster_count_cache = ClusterCountCache()
+
+
 class AdvancedCustomerAnalytics:
-    def __init__(self, df):
+    def __init__(self, df=None, vendor_aggregates=None):
+        """df is the bill frame; vendor_aggregates (from aggregate_vendor_features) lets
+        RFM and churn run without it"""
         self.df = df
-        self.preprocess_data()
+        self.vendor_aggregates = vendor_aggregates
+        self._vendor_features = None
+        if df is not None:
+            self.preprocess_data()
         
     def preprocess_data(self):
         """Preprocess the data with advanced cleaning and feature engineering"""
@@ -27,27 +136,55 @@ class AdvancedCustomerAnalytics:
         self.df['dayOfWeek'] = self.df['Date'].dt.dayofweek
         self.df['month'] = self.df['Date'].dt.month
         self.df['isWeekend'] = self.df['dayOfWeek'].isin([5, 6]).astype(int)
+        self.df['isDue'] = (self.df['paymentType'] == 'Due').astype(int)
         
         # Calculate per-transaction metrics
         self.df['itemsPerTransaction'] = self.df.groupby('billNumber')['quantity'].transform('sum')
         self.df['avgItemPrice'] = self.df['totalAmount'] / self.df['quantity']
         
         # Add customer lifetime value calculation
-        customer_totals = self.df.groupby('vendorName')['totalAmount'].sum()
-        self.df['customerLifetimeValue'] = self.df['vendorName'].map(customer_totals)
+        customer_totals = self.df.groupby('vendorName', observed=True)['totalAmount'].sum()
+        self.df['customerLifetimeValue'] = self.df['vendorName'].map(customer_totals).astype(float)
+
+    def vendor_features(self):
+        """Per-vendor feature table shared by RFM, segmentation, payment and churn, built once"""
+        if self._vendor_features is not None:
+            return self._vendor_features
+        if self.df is None:
+            return self.vendor_aggregates
+
+        vendor_features = self.df.groupby('vendorName', observed=True).agg({
+            'Date': 'max',
+            'totalAmount': ['sum', 'mean', 'std'],
+            'quantity': ['sum', 'mean'],
+            'billNumber': 'count',
+            'isDue': 'mean',
+            'isWeekend': 'mean',
+            'itemsPerTransaction': ['mean', 'max'],
+            'avgItemPrice': 'mean',
+            'customerLifetimeValue': 'first'
+        })
+        
+        # Flatten column names
+        vendor_features.columns = ['_'.join(col).strip() for col in vendor_features.columns.values]
+        vendor_features = vendor_features.rename(columns={'Date_max': 'last_date'})
+        
+        feature_columns = vendor_features.columns.drop('last_date')
+        vendor_features[feature_columns] = vendor_features[feature_columns].fillna(0)
+
+        self._vendor_features = vendor_features
+        return vendor_features
 
     def perform_rfm_analysis(self):
         """Perform RFM (Recency, Frequency, Monetary) Analysis"""
-        current_date = self.df['Date'].max()
-        
-        rfm = self.df.groupby('vendorName').agg({
-            'Date': lambda x: (current_date - x.max()).days,  # Recency
-            'billNumber': 'count',  # Frequency
-            'totalAmount': 'sum'    # Monetary
-        }).rename(columns={
-            'Date': 'recency',
-            'billNumber': 'frequency',
-            'totalAmount': 'monetary'
+        # Aggregates from the shared vendor table (or the database)
+        features = self.vendor_aggregates if self.vendor_aggregates is not None else self.vendor_features()
+        current_date = features['last_date'].max()
+        
+        rfm = pd.DataFrame({
+            'recency': (current_date - features['last_date']).dt.days,  # Recency
+            'frequency': features['billNumber_count'].astype(int),     # Frequency
+            'monetary': features['totalAmount_sum']                     # Monetary
         })
         
         # Score each RFM metric
@@ -69,22 +206,28 @@ class AdvancedCustomerAnalytics:
 
     def predict_churn(self, churn_threshold_days=90):
         """Predict customer churn using machine learning"""
+        churn_model = self.train_churn_model(churn_threshold_days)
+        
+        return {
+            'model': churn_model['model'],
+            'auc_score': churn_model['auc_score'],
+            'precision': churn_model['precision'],
+            'recall': churn_model['recall'],
+            'feature_importance': churn_model['feature_importance'],
+            'churn_probabilities': self.score_churn(churn_model)
+        }
+
+    def train_churn_model(self, churn_threshold_days=90, n_jobs=None):
+        """Train the churn classifier and bundle it with its feature schema and metrics"""
+        # Aggregates from the shared vendor table (or the database)
+        features = self.vendor_aggregates if self.vendor_aggregates is not None else self.vendor_features()
+        
         # Calculate days since last purchase for each customer
-        current_date = self.df['Date'].max()
-        last_purchase_dates = self.df.groupby('vendorName')['Date'].max()
-        days_since_purchase = (current_date - last_purchase_dates).dt.days
+        current_date = features['last_date'].max()
+        days_since_purchase = (current_date - features['last_date']).dt.days
         
         # Create features for churn prediction
-        churn_features = self.df.groupby('vendorName').agg({
-            'totalAmount': ['mean', 'sum', 'std'],
-            'quantity': ['mean', 'sum'],
-            'billNumber': 'count',
-            'itemsPerTransaction': ['mean', 'max'],
-            'avgItemPrice': 'mean'
-        }).fillna(0)
-        
-        # Flatten column names
-        churn_features.columns = ['_'.join(col).strip() for col in churn_features.columns.values]
+        churn_features = features[CHURN_FEATURES]
         
         # Define churn (1 if customer hasn't purchased in threshold days)
         churn_labels = (days_since_purchase > churn_threshold_days).astype(int)
@@ -95,7 +238,7 @@ class AdvancedCustomerAnalytics:
         )
         
         # Train model
-        clf = RandomForestClassifier(n_estimators=100, random_state=42)
+        clf = RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=n_jobs)
         clf.fit(X_train, y_train)
         
         # Make predictions
@@ -115,54 +258,76 @@ class AdvancedCustomerAnalytics:
         
         return {
             'model': clf,
+            'feature_schema': list(churn_features.columns),
+            'churn_threshold_days': churn_threshold_days,
             'auc_score': auc_score,
             'precision': precision,
             'recall': recall,
-            'feature_importance': feature_importance,
-            'churn_probabilities': pd.Series(clf.predict_proba(churn_features)[:, 1], index=churn_features.index)
+            'feature_importance': feature_importance
         }
 
-    def perform_customer_segmentation(self, n_clusters=None):
-        """Advanced customer segmentation using multiple features and optimal cluster selection"""
+    def score_churn(self, churn_model, vendor_names=None, n_jobs=None):
+        """Churn probabilities from a trained churn model for the given vendors (all by default)"""
+        features = self.vendor_aggregates if self.vendor_aggregates is not None else self.vendor_features()
+        churn_features = features[churn_model['feature_schema']]
+        if vendor_names is not None:
+            churn_features = churn_features[churn_features.index.isin(vendor_names)]
+        if churn_features.empty:
+            return pd.Series(dtype=float)
+        
+        clf = churn_model['model']
+        if n_jobs is not None:
+            clf.set_params(n_jobs=n_jobs)
+        return pd.Series(clf.predict_proba(churn_features)[:, 1], index=churn_features.index)
+
+    def perform_customer_segmentation(self, n_clusters=None, fast=False, silhouette_sample_size=2000):
+        """Advanced customer segmentation using multiple features and optimal cluster selection.
+
+        fast=True selects k with MiniBatchKMeans and a sampled silhouette score,
+        and reuses the chosen k until the vendor population shifts materially.
+        """
         # Create feature matrix
-        vendor_features = self.df.groupby('vendorName').agg({
-            'totalAmount': ['sum', 'mean', 'std'],
-            'quantity': ['sum', 'mean'],
-            'billNumber': 'count',
-            'paymentType': lambda x: (x == 'Due').mean(),
-            'isWeekend': 'mean',
-            'itemsPerTransaction': 'mean',
-            'customerLifetimeValue': 'first'
-        }).fillna(0)
-        
-        # Flatten column names
-        vendor_features.columns = ['_'.join(col).strip() for col in vendor_features.columns.values]
+        vendor_features = self.vendor_features()[SEGMENTATION_FEATURES]
         
         # Scale features
         scaler = StandardScaler()
         features_scaled = scaler.fit_transform(vendor_features)
         
+        if n_clusters is None and fast:
+            n_clusters = _cluster_count_cache.get(vendor_features.index)
+            
         # Determine optimal number of clusters if not specified
+        kmeans = None
         if n_clusters is None:
             silhouette_scores = []
+            models = []
             K = range(2, min(8, len(features_scaled) -1))
+            sample_size = silhouette_sample_size if fast and len(features_scaled) > silhouette_sample_size else None
             
             for k in K:
-                kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
+                kmeans = self._make_kmeans(k, fast)
                 kmeans.fit(features_scaled)
+                models.append(kmeans)
                 
                 labels = kmeans.labels_
                 if len(np.unique(labels)) >= 2 and len(np.unique(labels)) < len(features_scaled):
-                    score = silhouette_score(features_scaled, labels)
+                    score = silhouette_score(features_scaled, labels, sample_size=sample_size, random_state=42)
                     silhouette_scores.append(score)
                 else:
                     silhouette_scores.append(-1)
                     
-            n_clusters = K[np.argmax(silhouette_scores)]
+            best = int(np.argmax(silhouette_scores))
+            n_clusters = K[best]
+            # Reuse the winning fitted model instead of refitting it
+            kmeans = models[best]
+            if fast:
+                _cluster_count_cache.set(vendor_features.index, n_clusters)
+        else:
+            # Perform clustering
+            kmeans = self._make_kmeans(n_clusters, fast)
+            kmeans.fit(features_scaled)
             
-        # Perform clustering
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-        clusters = kmeans.fit_predict(features_scaled)
+        clusters = kmeans.labels_
         
         # Add cluster assignments and features to results
         results = vendor_features.copy()
@@ -177,8 +342,18 @@ class AdvancedCustomerAnalytics:
             
         return results, cluster_profiles
 
-    def analyze_purchase_patterns(self):
-        """Analyze temporal patterns and product associations"""
+    def _make_kmeans(self, n_clusters, fast):
+        if fast:
+            return MiniBatchKMeans(n_clusters=n_clusters, random_state=42, n_init=3, batch_size=1024)
+        return KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+
+    def analyze_purchase_patterns(self, sparse_baskets=True, max_len=None):
+        """Analyze temporal patterns and product associations.
+
+        With sparse_baskets the bill-by-SKU basket is a sparse boolean matrix mined
+        with FP-growth instead of a dense crosstab. max_len optionally caps the itemset size
+        (e.g. 3 for much faster mining), by default rules of every size are kept.
+        """
         # Temporal analysis
         temporal_patterns = self.df.groupby(['dayOfWeek', 'isWeekend']).agg({
             'totalAmount': ['mean', 'count', 'sum'],
@@ -187,12 +362,20 @@ class AdvancedCustomerAnalytics:
         }).round(2)
         
         # Product association analysis with confidence filtering
-        basket = pd.crosstab(self.df['billNumber'], self.df['productSku'])
-        basket_sets = (basket > 0).astype(int)
-        
-        frequent_itemsets = apriori(basket_sets, min_support=0.01, use_colnames=True)
-        rules = association_rules(frequent_itemsets, metric="lift", min_threshold=1)
-        rules = rules[rules['confidence'] >= 0.5]
+        if sparse_baskets:
+            frequent_itemsets = fpgrowth(self._sparse_basket(min_support=0.01), min_support=0.01,
+                                         use_colnames=True, max_len=max_len)
+            rules = pd.DataFrame(
+                stream_association_rules(frequent_itemsets, min_confidence=0.5, min_lift=1),
+                columns=RULE_COLUMNS
+            )
+        else:
+            basket = pd.crosstab(self.df['billNumber'], self.df['productSku'])
+            basket_sets = (basket > 0).astype(int)
+            
+            frequent_itemsets = apriori(basket_sets, min_support=0.01, use_colnames=True, max_len=max_len)
+            rules = association_rules(frequent_itemsets, metric="lift", min_threshold=1)
+            rules = rules[rules['confidence'] >= 0.5]
         
         # Add seasonality analysis
         seasonality = self.df.groupby('month').agg({
@@ -203,21 +386,29 @@ class AdvancedCustomerAnalytics:
         
         return temporal_patterns, rules, seasonality
 
+    def _sparse_basket(self, min_support):
+        """Sparse boolean bill-by-SKU matrix, without SKUs that cannot reach min_support"""
+        lines = self.df[['billNumber', 'productSku']].dropna()
+        bill_codes, bills = pd.factorize(lines['billNumber'])
+        sku_codes, skus = pd.factorize(lines['productSku'])
+        
+        basket = sparse.csr_matrix(
+            (np.ones(len(lines), dtype=bool), (bill_codes, sku_codes)),
+            shape=(len(bills), len(skus))
+        )
+        
+        # An itemset is never more frequent than its rarest item
+        item_support = np.asarray(basket.sum(axis=0)).ravel() / max(len(bills), 1)
+        frequent = np.flatnonzero(item_support >= min_support)
+        
+        return pd.DataFrame.sparse.from_spmatrix(basket[:, frequent], columns=skus[frequent])
+
     def predict_payment_behavior(self):
         """Predict payment behavior using Random Forest"""
-        features = self.df.groupby('vendorName').agg({
-            'totalAmount': ['mean', 'sum', 'std'],
-            'quantity': ['mean', 'sum'],
-            'itemsPerTransaction': ['mean', 'max'],
-            'isWeekend': 'mean',
-            'customerLifetimeValue': 'first'
-        }).fillna(0)
-        
-        features.columns = ['_'.join(col).strip() for col in features.columns.values]
+        vendor_features = self.vendor_features()
+        features = vendor_features[PAYMENT_FEATURES]
         
-        target = (self.df.groupby('vendorName')['paymentType']
-                 .agg(lambda x: (x == 'Due').mean() > 0.5)
-                 .astype(int))
+        target = (vendor_features['isDue_mean'] > 0.5).astype(int)
         
         X_train, X_test, y_train, y_test = train_test_split(
             features, target, test_size=0.2, random_state=42
@@ -233,11 +424,11 @@ class AdvancedCustomerAnalytics:
         
         return clf, feature_importance
 
-    def generate_customer_insights(self):
+    def generate_customer_insights(self, sparse_baskets=True, max_len=None):
         """Generate comprehensive customer insights"""
         rfm_analysis = self.perform_rfm_analysis()
         segmentation, cluster_profiles = self.perform_customer_segmentation()
-        temporal_patterns, association_rules, seasonality = self.analyze_purchase_patterns()
+        temporal_patterns, association_rules, seasonality = self.analyze_purchase_patterns(sparse_baskets, max_len)
         _, payment_features = self.predict_payment_behavior()
         churn_analysis = self.predict_churn()
         
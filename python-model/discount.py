@@ -2,13 +2,39 @@ import pandas as pd
 from datetime import datetime, timedelta
 import numpy as np
 
+# Discount tiers by days until expiry: <= 1 day 70%, <= 4 days 50%, <= 7 days 20%, otherwise 5%
+DISCOUNT_TIER_DAYS = [2, 5, 8]
+DISCOUNT_TIER_RATES = np.array([70, 50, 20, 5], dtype=float)
+
+# Fields of each recommendation in the report, in output order
+REPORT_COLUMNS = [
+    'name', 'sku', 'category', 'current_stock', 'days_until_expiry', 'risk_score',
+    'suggested_discount', 'current_price', 'status', 'discounted_price'
+]
+
+def round_prices(values, decimals=2):
+    """Column-wise round() that matches Python's rounding of exact halves"""
+    values = np.asarray(values, dtype=float)
+    rounded = np.round(values, decimals)
+    # np.round goes to even on scaled halves, so redo the near-ties one by one
+    scaled = values * 10 ** decimals
+    ties = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    rounded[ties] = [round(value, decimals) for value in values[ties].tolist()]
+    return rounded
+
 class ExpiryManagementSystem:
-    def __init__(self, data):
-        """Initialize the system with product data"""
+    def __init__(self, data, today=None, maxima=None):
+        """Initialize the system with product data.
+
+        today defaults to the current date. maxima can supply the catalogue-wide
+        maximum of days_until_expiry, stock_ratio and price used to normalize the
+        risk score when data is only part of the catalogue.
+        """
         self.df = pd.DataFrame(data)
         self.df['manufacturing_date'] = pd.to_datetime(self.df['manufacturing_date'])
         self.df['expiry_date'] = pd.to_datetime(self.df['expiry_date'])
-        self.today = pd.Timestamp('2025-02-05')  # Current date
+        self.today = pd.Timestamp(today).normalize() if today is not None else pd.Timestamp.now().normalize()
+        self.maxima = maxima or {}
 
     def calculate_risk_scores(self):
         """Calculate risk scores for products based on multiple factors"""
@@ -18,14 +44,19 @@ class ExpiryManagementSystem:
         # Calculate stock ratio (current stock vs low stock threshold)
         self.df['stock_ratio'] = self.df['stock'] / self.df['lowStockThreshold']
 
+        # Normalize by the catalogue-wide maxima
+        max_days = self.maxima.get('days_until_expiry', self.df['days_until_expiry'].max())
+        max_stock_ratio = self.maxima.get('stock_ratio', self.df['stock_ratio'].max())
+        max_price = self.maxima.get('price', self.df['price'].max())
+
         # Calculate risk score (0-100, higher means higher risk of waste)
         self.df['risk_score'] = 100 * (
             # More weight to items closer to expiry
-            0.5 * (1 - self.df['days_until_expiry'] / self.df['days_until_expiry'].max()) +
+            0.5 * (1 - self.df['days_until_expiry'] / max_days) +
             # More weight to items with high stock compared to threshold
-            0.3 * (self.df['stock_ratio'] / self.df['stock_ratio'].max()) +
+            0.3 * (self.df['stock_ratio'] / max_stock_ratio) +
             # More weight to higher priced items
-            0.2 * (self.df['price'] / self.df['price'].max())
+            0.2 * (self.df['price'] / max_price)
         )
 
         return self.df
@@ -34,21 +65,10 @@ class ExpiryManagementSystem:
         """Suggest discounts based on risk scores"""
         high_risk = self.df[self.df['risk_score'] >= risk_threshold].copy()
         
-        # Check for expired products first
-        expired_mask = high_risk['days_until_expiry'] <= 0
-        high_risk.loc[expired_mask, 'suggested_discount'] = -1  # Flag for expired products
-        
-        # Calculate discounts only for non-expired products
-        non_expired_mask = ~expired_mask
-        high_risk.loc[non_expired_mask, 'suggested_discount'] = np.where(
-            high_risk.loc[non_expired_mask, 'days_until_expiry'] <= 1, 70,
-            np.where(
-                high_risk.loc[non_expired_mask, 'days_until_expiry'] <= 4, 50,
-                np.where(
-                    high_risk.loc[non_expired_mask, 'days_until_expiry'] <= 7, 20, 5
-                )
-            )
-        )
+        # Expired products are flagged with -1, the rest binned into discount tiers
+        days = high_risk['days_until_expiry'].to_numpy()
+        tiers = DISCOUNT_TIER_RATES[np.digitize(days, DISCOUNT_TIER_DAYS)]
+        high_risk['suggested_discount'] = np.where(days <= 0, -1.0, tiers)
 
         return high_risk
 
@@ -57,6 +77,8 @@ class ExpiryManagementSystem:
         self.calculate_risk_scores()
         high_risk_products = self.suggest_discounts()
 
+        recommendations = self.build_recommendations(high_risk_products)
+
         report = {
             'summary': {
                 'total_products': len(self.df),
@@ -64,31 +86,28 @@ class ExpiryManagementSystem:
                 'total_inventory_value': self.df['price'].sum(),
                 'at_risk_value': high_risk_products['price'].sum()
             },
-            'recommendations': []
+            # One record per high-risk product
+            'recommendations': recommendations.to_dict('records')
         }
 
-        # Generate specific recommendations for each high-risk product
-        for _, product in high_risk_products.iterrows():
-            recommendation = {
-                'name': product['name'],
-                'sku': product['sku'],
-                'category': product['category'],
-                'current_stock': product['stock'],
-                'days_until_expiry': product['days_until_expiry'],
-                'risk_score': round(product['risk_score'], 2),
-                'suggested_discount': product['suggested_discount'],
-                'current_price': product['price'],
-            }
-            
-            # Handle expired products
-            if product['days_until_expiry'] <= 0:
-                recommendation['status'] = "EXPIRED - DO NOT SELL"
-                recommendation['discounted_price'] = None
-            else:
-                recommendation['status'] = "Active"
-                recommendation['discounted_price'] = round(product['price'] * (1 - product['suggested_discount']/100), 2)
-                
-            report['recommendations'].append(recommendation)
-
         return report
 
+    def build_recommendations(self, products):
+        """Recommendation table for products that have risk scores and suggested discounts"""
+        # Build the recommendations column by column
+        expired = products['days_until_expiry'].to_numpy() <= 0
+        discounted_price = round_prices(products['price'] * (1 - products['suggested_discount'] / 100))
+        recommendations = pd.DataFrame({
+            'name': products['name'],
+            'sku': products['sku'],
+            'category': products['category'],
+            'current_stock': products['stock'],
+            'days_until_expiry': products['days_until_expiry'],
+            'risk_score': round_prices(products['risk_score']),
+            'suggested_discount': products['suggested_discount'],
+            'current_price': products['price'],
+            'status': np.where(expired, "EXPIRED - DO NOT SELL", "Active"),
+            # Expired products have no sale price
+            'discounted_price': np.where(expired, None, discounted_price)
+        }, columns=REPORT_COLUMNS)
+        return recommendations
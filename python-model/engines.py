@@ -0,0 +1,141 @@
+"""Lazy loading of the analytics engines and a startup import-cost report.
+
+Run ``python engines.py`` to see where the service spends its startup time.
+"""
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# Engine modules and the class each one provides
+ENGINES = {
+    'model': 'ComprehensiveRecommendationModel',
+    'customer': 'AdvancedCustomerAnalytics',
+    'discount': 'ExpiryManagementSystem',
+    'supplier': 'SupplierAnalysis',
+    'fraud_detection': 'FraudDetection'
+}
+
+# Seconds spent importing each engine module, filled in on first use
+import_times = {}
+_lock = threading.Lock()
+
+
+def load(module_name):
+    """Import an engine module on first use and record how long it took"""
+    module = sys.modules.get(module_name)
+    if module is not None and module_name in import_times:
+        return module
+
+    with _lock:
+        if module_name not in import_times:
+            start = time.perf_counter()
+            module = importlib.import_module(module_name)
+            import_times[module_name] = time.perf_counter() - start
+    return sys.modules[module_name]
+
+
+class LazyEngine:
+    def __init__(self, module_name, attribute=None):
+        """Stand-in for an engine class whose module is only imported when first called"""
+        self.module_name = module_name
+        self.attribute = attribute or ENGINES[module_name]
+
+    def resolve(self):
+        return getattr(load(self.module_name), self.attribute)
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        # Only forward class attributes, never our own (e.g. while unpickling)
+        if name.startswith('__') or name in ('module_name', 'attribute'):
+            raise AttributeError(name)
+        return getattr(self.resolve(), name)
+
+
+def prewarm(module_names=None, background=True):
+    """Import the engine modules ahead of the first request, by default in a daemon thread"""
+    module_names = list(module_names or ENGINES)
+
+    def run():
+        for module_name in module_names:
+            try:
+                load(module_name)
+            except ImportError:
+                # Optional engine dependencies (e.g. TensorFlow) may not be installed
+                pass
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name='engine-prewarm', daemon=True)
+    thread.start()
+    return thread
+
+
+def import_profile(target='app'):
+    """Run `python -X importtime -c 'import target'` and return (self_us, cumulative_us, module) rows"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, IMS_PREWARM='0')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {target}'],
+        cwd=here, env=env, capture_output=True, text=True
+    )
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        rows.append((int(self_us), int(cumulative_us), module.rstrip()))
+    return rows, result.returncode
+
+
+def startup_report(target='app', top=15):
+    """Text report of total import time, the slowest imports of the target and each engine"""
+    rows, returncode = import_profile(target)
+    lines = []
+    if returncode != 0:
+        lines.append(f'warning: importing {target} exited with status {returncode}')
+
+    # importtime lists modules in post-order: the direct imports of the target
+    # (indent 3) appear just before the target's own top-level row (indent 1)
+    children, pending, total_us = {}, {}, 0
+    for self_us, cumulative_us, module in rows:
+        name = module.strip()
+        depth = len(module) - len(module.lstrip())
+        if depth == 3:
+            pending[name] = cumulative_us
+        elif depth == 1:
+            if name == target:
+                children, total_us = pending, cumulative_us
+            pending = {}
+
+    lines.append(f'import {target}: {total_us / 1e6:.3f}s across {len(rows)} modules')
+    lines.append('')
+    lines.append(f'slowest imports made by {target}:')
+    for name, cumulative_us in sorted(children.items(), key=lambda item: item[1], reverse=True)[:top]:
+        lines.append(f'  {cumulative_us / 1e6:8.3f}s  {name}')
+
+    lines.append('')
+    lines.append('engine import cost (in-process, deferred until first use):')
+    for module_name in ENGINES:
+        try:
+            load(module_name)
+            lines.append(f'  {import_times[module_name]:8.3f}s  {module_name}')
+        except ImportError as e:
+            lines.append(f'  {"n/a":>8}   {module_name} ({e})')
+
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report the startup import cost of the analytics service')
+    parser.add_argument('--target', default='app', help='module to profile (default: app)')
+    parser.add_argument('--top', type=int, default=15, help='number of top-level imports to list')
+    args = parser.parse_args()
+    print(startup_report(args.target, args.top))
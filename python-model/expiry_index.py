@@ -0,0 +1,180 @@
+import heapq
+import math
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+import pandas as pd
+
+from discount import DISCOUNT_TIER_DAYS, ExpiryManagementSystem
+
+# Fields kept per product, enough to score and report it
+INDEX_FIELDS = ['name', 'sku', 'category', 'stock', 'lowStockThreshold', 'price', 'manufacturing_date', 'expiry_date']
+
+# Days until expiry on which a product enters a new discount tier (0 = expires today)
+TIER_CROSSING_DAYS = sorted({0} | {edge - 1 for edge in DISCOUNT_TIER_DAYS})
+
+
+class _RunningMax:
+    def __init__(self):
+        """Maximum of per-SKU values under updates, a max-heap with lazy deletion"""
+        self._values = {}
+        self._heap = []
+
+    def set(self, sku, value):
+        self._values[sku] = value
+        # NaN never wins a pandas max, so it is not pushed
+        if not math.isnan(value):
+            heapq.heappush(self._heap, (-value, sku))
+        if len(self._heap) > 2 * len(self._values) + 64:
+            self._compact()
+
+    def discard(self, sku):
+        self._values.pop(sku, None)
+
+    def max(self):
+        # Pop entries whose SKU was removed or has a newer value
+        while self._heap and self._values.get(self._heap[0][1]) != -self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return -self._heap[0][0] if self._heap else float('nan')
+
+    def _compact(self):
+        self._heap = [(-value, sku) for sku, value in self._values.items() if not math.isnan(value)]
+        heapq.heapify(self._heap)
+
+
+class ExpiryIndex:
+    def __init__(self, products=None):
+        """Products bucketed by expiry day, updated incrementally as the catalogue changes.
+
+        Updates happen in place, so they and every read hold self._lock.
+        """
+        self.key = None
+        self._lock = threading.Lock()
+        self._products = {}
+        self._hashes = {}
+        self._expiry = {}
+        self._buckets = {}
+        self._days = []
+        self._stock_ratio = _RunningMax()
+        self._price = _RunningMax()
+        if products is not None:
+            self.update(products)
+
+    def refresh(self, key, products):
+        """Sync with the products frame once per key (e.g. snapshot version)"""
+        if self.key == key:
+            return self
+        with self._lock:
+            if self.key != key:
+                self._update(products)
+                self.key = key
+        return self
+
+    def update(self, products):
+        """Apply the rows that changed since the last update and drop SKUs no longer present"""
+        with self._lock:
+            self._update(products)
+
+    def _update(self, products):
+        products = products.drop_duplicates('sku', keep='last')
+        fields = [field for field in INDEX_FIELDS if field in products.columns]
+        hashes = pd.util.hash_pandas_object(products[fields].astype(str), index=False).to_numpy()
+        skus = products['sku'].tolist()
+
+        incoming = set(skus)
+        for sku in [sku for sku in self._products if sku not in incoming]:
+            self._remove(sku)
+
+        changed = [i for i, (sku, row_hash) in enumerate(zip(skus, hashes)) if self._hashes.get(sku) != row_hash]
+        if not changed:
+            return
+        products = products.iloc[changed]
+        stock_ratios = (products['stock'] / products['lowStockThreshold']).to_numpy(dtype=float)
+        prices = pd.to_numeric(products['price'], errors='coerce').to_numpy(dtype=float)
+        records = products[fields].to_dict('records')
+        for i, record, stock_ratio, price in zip(changed, records, stock_ratios, prices):
+            self._upsert(record, hashes[i], stock_ratio, price)
+
+    def remove(self, sku):
+        with self._lock:
+            self._remove(sku)
+
+    def _remove(self, sku):
+        if sku not in self._products:
+            return
+        del self._products[sku]
+        del self._hashes[sku]
+        self._unbucket(sku)
+        self._stock_ratio.discard(sku)
+        self._price.discard(sku)
+
+    def maxima(self, today):
+        """Catalogue-wide maxima ExpiryManagementSystem normalizes risk scores by"""
+        with self._lock:
+            return self._maxima(today)
+
+    def _maxima(self, today):
+        max_days = (self._days[-1] - today).days if self._days else float('nan')
+        return {
+            'days_until_expiry': max_days,
+            'stock_ratio': self._stock_ratio.max(),
+            'price': self._price.max()
+        }
+
+    def expiring_between(self, start, end):
+        """SKUs expiring on days in [start, end]"""
+        with self._lock:
+            low = bisect_left(self._days, pd.Timestamp(start).normalize())
+            high = bisect_right(self._days, pd.Timestamp(end).normalize())
+            return [sku for day in self._days[low:high] for sku in self._buckets[day]]
+
+    def crossing_tiers(self, today=None):
+        """Discount recommendations for the products entering a new discount tier today"""
+        today = pd.Timestamp(today).normalize() if today is not None else pd.Timestamp.now().normalize()
+        # Copy out what is needed under the lock, scoring happens outside it
+        with self._lock:
+            skus = [
+                sku
+                for days in TIER_CROSSING_DAYS
+                # Sorted so the output (and its ETag) is the same in every process
+                for sku in sorted(self._buckets.get(today + pd.Timedelta(days=days), ()))
+            ]
+            if not skus:
+                return []
+            records = [self._products[sku] for sku in skus]
+            maxima = self._maxima(today)
+
+        # Score just these products against the whole catalogue
+        expiry_system = ExpiryManagementSystem(records, today, maxima)
+        expiry_system.calculate_risk_scores()
+        products = expiry_system.suggest_discounts(risk_threshold=float('-inf'))
+        return expiry_system.build_recommendations(products).to_dict('records')
+
+    def _upsert(self, record, row_hash, stock_ratio, price):
+        sku = record['sku']
+        self._products[sku] = record
+        self._hashes[sku] = row_hash
+
+        expiry = pd.Timestamp(record.get('expiry_date'))
+        expiry = None if pd.isna(expiry) else expiry.normalize()
+        if self._expiry.get(sku) != expiry:
+            self._unbucket(sku)
+            if expiry is not None:
+                if expiry not in self._buckets:
+                    self._buckets[expiry] = set()
+                    insort(self._days, expiry)
+                self._buckets[expiry].add(sku)
+                self._expiry[sku] = expiry
+
+        self._stock_ratio.set(sku, float(stock_ratio))
+        self._price.set(sku, float(price))
+
+    def _unbucket(self, sku):
+        expiry = self._expiry.pop(sku, None)
+        if expiry is None:
+            return
+        bucket = self._buckets[expiry]
+        bucket.discard(sku)
+        if not bucket:
+            del self._buckets[expiry]
+            del self._days[bisect_left(self._days, expiry)]
@@ -1,24 +1,129 @@
+import copy
+import logging
+import os
+import threading
+import time
+
 from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import IsolationForest
-from keras.models import Model
-from keras.layers import Input, Dense
-from keras import regularizers
+import joblib
 import numpy as np
 import pandas as pd
 
+FRAUD_FEATURES = ["quantity", "totalAmount", "difference"]
+
+# Batches up to this size are scored with IsolationForestScorer row by row,
+# larger ones with a single IsolationForest.decision_function call
+SCORER_MAX_ROWS = 64
+
+UNKNOWN_SKU_ERROR = "SKU not found in the products data."
+
+logger = logging.getLogger(__name__)
+
+
+def average_path_length(n_samples):
+    """Average path length of an unsuccessful BST search over n_samples points"""
+    if n_samples <= 1:
+        return 0.0
+    if n_samples == 2:
+        return 1.0
+    return 2.0 * (np.log(n_samples - 1.0) + np.euler_gamma) - 2.0 * (n_samples - 1.0) / n_samples
+
+
+class IsolationForestScorer:
+    def __init__(self, iso_forest):
+        """Scores single rows against a fitted IsolationForest by walking its trees in plain Python.
+
+        sklearn's decision_function has a few milliseconds of fixed overhead per
+        call, which dominates when scoring one transaction at a time.
+        """
+        self.offset = iso_forest.offset_
+        self.normalizer = len(iso_forest.estimators_) * average_path_length(iso_forest._max_samples)
+        self.trees = []
+        for tree, features in zip(iso_forest.estimators_, iso_forest.estimators_features_):
+            nodes = tree.tree_
+            # Path length contributed by ending in each node: its depth plus the
+            # expected remaining depth of the samples it still holds
+            depth = np.zeros(nodes.node_count)
+            for node in range(nodes.node_count):
+                for child in (nodes.children_left[node], nodes.children_right[node]):
+                    if child != -1:
+                        depth[child] = depth[node] + 1
+            leaf_length = [
+                depth[node] + average_path_length(nodes.n_node_samples[node])
+                for node in range(nodes.node_count)
+            ]
+            self.trees.append((
+                nodes.children_left.tolist(),
+                nodes.children_right.tolist(),
+                [int(features[f]) if f >= 0 else -1 for f in nodes.feature],
+                nodes.threshold.tolist(),
+                leaf_length
+            ))
+
+    def decision_function(self, x):
+        """Same value as IsolationForest.decision_function for one scaled feature row"""
+        x = [float(value) for value in x]
+        total = 0.0
+        for left, right, feature, threshold, leaf_length in self.trees:
+            node = 0
+            while left[node] != -1:
+                node = left[node] if x[feature[node]] <= threshold[node] else right[node]
+            total += leaf_length[node]
+        return float(-(2.0 ** (-total / self.normalizer)) - self.offset)
+
+
 class FraudDetection:
-    def __init__(self, products_df, bills_df):
+    def __init__(self, products_df, bills_df=None, path=None, save_interval=300,
+                 reservoir_size=50000, warm_start_epochs=5):
+        """Fraud models over bills merged with products.
+
+        fit_models trains from scratch on bills_df. After that sync() keeps the
+        models current by warm-starting on the bills past the last_bill_id
+        watermark: the scaler is updated incrementally, the autoencoder trains
+        for warm_start_epochs on the new rows only, and the IsolationForest is
+        refit on a reservoir sample of reservoir_size rows from all bills seen.
+        When a path is given the models are saved there at most every
+        save_interval seconds, and load() restores them without retraining.
+        """
         self.products_df = products_df
-        self.bills_df = bills_df
+        self.bills_df = bills_df if bills_df is not None else pd.DataFrame(columns=["productSku", "quantity", "totalAmount"])
+        self.path = path
+        self.save_interval = save_interval
+        self.reservoir_size = reservoir_size
+        self.warm_start_epochs = warm_start_epochs
+
         self.data_df = self.prepare_data()
         self.scaler = StandardScaler()
         self.iso_forest = IsolationForest(contamination=0.05, random_state=42)
-        self.autoencoder = self.build_autoencoder()
+        # The Keras model is only built when it has to be trained
+        self.autoencoder = None
+        self.autoencoder_weights = None
         self.threshold = None
+        self.anomalies = None
+
+        # Training-data watermark and a uniform sample of every feature row seen
+        self.last_bill_id = None
+        self.reservoir = None
+        self.rows_seen = 0
+        self._rng = np.random.default_rng(42)
+
+        self.set_products(products_df)
+        self._models = None
+        self._last_save = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_products(self, products_df):
+        """Swap in a new product catalogue, used for prices of bills scored from now on"""
+        self.products_df = products_df
+        # Price lookup for the real-time scoring path, first row per SKU wins
+        products = products_df.drop_duplicates("sku")
+        self.prices = dict(zip(products["sku"], products["price"]))
 
-    def prepare_data(self):
+    def prepare_data(self, bills_df=None):
+        bills_df = bills_df if bills_df is not None else self.bills_df
         # Merge the two datasets using the products' productSku and bills' sku columns.
-        data_df = pd.merge(self.bills_df, self.products_df, left_on="productSku", right_on="sku", how="left")
+        data_df = pd.merge(bills_df, self.products_df, left_on="productSku", right_on="sku", how="left")
         # Compute the expected total amount using the product's price and the bill's quantity.
         data_df["expected_total"] = data_df["price"] * data_df["quantity"]
         # Compute the difference between the actual total_amount and the expected_total.
@@ -26,39 +131,189 @@ class FraudDetection:
         return data_df
 
     def fit_models(self):
+        """Train every model from scratch on bills_df"""
         # For anomaly detection, we select a few numeric features.
-        features = ["quantity", "totalAmount", "difference"]
-        X = self.data_df[features].values
+        X = self.data_df[FRAUD_FEATURES].values
         X_scaled = self.scaler.fit_transform(X)
 
         # Fit Isolation Forest
         self.iso_forest.fit(X_scaled)
 
         # Fit Autoencoder
-        history = self.autoencoder.fit(
-            X_scaled, X_scaled,
-            epochs=50,
-            batch_size=32,
-            shuffle=True,
-            validation_split=0.1,
-            verbose=0
-        )
+        try:
+            self.autoencoder = self.build_autoencoder()
+        except ImportError as e:
+            # Without Keras the Isolation Forest flags anomalies on its own
+            logger.warning("Keras unavailable, fitting the Isolation Forest only: %s", e)
+            self.autoencoder, self.autoencoder_weights, self.threshold = None, None, None
+        else:
+            history = self.autoencoder.fit(
+                X_scaled, X_scaled,
+                epochs=50,
+                batch_size=32,
+                shuffle=True,
+                validation_split=0.1,
+                verbose=0
+            )
+            self.autoencoder_weights = [np.asarray(w, dtype=float) for w in self.autoencoder.get_weights()]
 
         # Compute the reconstruction error (MSE) for each sample.
-        reconstructions = self.autoencoder.predict(X_scaled)
-        mse = np.mean(np.power(X_scaled - reconstructions, 2), axis=1)
+        mse = self.reconstruction_errors(X_scaled)
         self.data_df["autoencoder_mse"] = mse
 
         # Define a threshold for anomalies, e.g., the 95th percentile of reconstruction errors.
-        self.threshold = np.percentile(mse, 95)
-        self.data_df["auto_anomaly"] = mse > self.threshold
+        if self.autoencoder_weights is not None:
+            self.threshold = np.percentile(mse, 95)
+        self.data_df["auto_anomaly"] = mse > self.threshold if self.threshold is not None else False
 
         # Flag a transaction as anomalous if either model flags it.
         iso_preds = self.iso_forest.predict(X_scaled)
         self.data_df["iso_anomaly"] = (iso_preds == -1)
         self.data_df["anomaly_flag"] = self.data_df["iso_anomaly"] | self.data_df["auto_anomaly"]
+        self.anomalies = self.data_df[self.data_df["anomaly_flag"]]
+
+        self.reservoir, self.rows_seen = None, 0
+        self._sample(X)
+        if "_id" in self.bills_df.columns and not self.bills_df.empty:
+            self.last_bill_id = self.bills_df["_id"].max()
+        self._publish()
+
+    def update_models(self, new_bills_df):
+        """Warm-start the fitted models on new bills only"""
+        data_df = self.prepare_data(new_bills_df)
+        X = data_df[FRAUD_FEATURES].values
+        if len(X) == 0:
+            return
+
+        # Train on copies so scoring keeps using the current models meanwhile
+        scaler = copy.deepcopy(self.scaler).partial_fit(X)
+        self._sample(X)
+        reservoir_scaled = scaler.transform(self.reservoir)
+
+        X_scaled = scaler.transform(X)
+
+        # A few epochs on the delta, starting from the current weights
+        # (fitted without Keras there is no autoencoder to warm-start)
+        weights, threshold = self.autoencoder_weights, self.threshold
+        if weights is not None:
+            try:
+                if self.autoencoder is None:
+                    self.autoencoder = self.build_autoencoder()
+                    self.autoencoder.set_weights(self.autoencoder_weights)
+                self.autoencoder.fit(
+                    X_scaled, X_scaled,
+                    epochs=self.warm_start_epochs,
+                    batch_size=32,
+                    shuffle=True,
+                    verbose=0
+                )
+                weights = [np.asarray(w, dtype=float) for w in self.autoencoder.get_weights()]
+            except ImportError as e:
+                # Models loaded from disk score without Keras, keep their autoencoder as is
+                logger.warning("Keras unavailable, skipping the autoencoder warm start: %s", e)
+
+        # Isolation Forest refit on the reservoir sample of all bills seen
+        iso_forest = IsolationForest(contamination=0.05, random_state=42).fit(reservoir_scaled)
+
+        # Threshold from the reservoir, so it reflects the whole history
+        if weights is not None:
+            threshold = np.percentile(self.reconstruction_errors(reservoir_scaled, weights), 95)
+
+        # Flag the new bills and add them to the anomaly history
+        new_mse = self.reconstruction_errors(X_scaled, weights)
+        data_df["autoencoder_mse"] = new_mse
+        data_df["auto_anomaly"] = new_mse > threshold if threshold is not None else False
+        data_df["iso_anomaly"] = iso_forest.predict(X_scaled) == -1
+        data_df["anomaly_flag"] = data_df["iso_anomaly"] | data_df["auto_anomaly"]
+        anomalies = data_df[data_df["anomaly_flag"]]
+
+        with self._lock:
+            self.scaler, self.iso_forest, self.threshold = scaler, iso_forest, threshold
+            self.autoencoder_weights = weights
+            self.anomalies = pd.concat([self.anomalies, anomalies], ignore_index=True)
+            self._publish()
+
+    @property
+    def fitted(self):
+        return self._models is not None
+
+    def sync(self, bills_df, products_df=None):
+        """Bring the models up to date with bills sorted by _id, training only on the new ones"""
+        if products_df is not None:
+            self.set_products(products_df)
+        if self._models is None:
+            self.bills_df = bills_df
+            self.data_df = self.prepare_data()
+            self.fit_models()
+            if self.path:
+                # A full fit is too expensive to risk losing
+                self.save(self.path)
+            return len(bills_df)
+
+        start = 0
+        if self.last_bill_id is not None:
+            start = bills_df["_id"].searchsorted(self.last_bill_id, side="right")
+        new_bills = bills_df.iloc[start:]
+        new_rows = len(new_bills)
+        if new_rows:
+            self.update_models(new_bills)
+            self.last_bill_id = new_bills["_id"].iloc[-1]
+
+        if new_rows and self.path and time.monotonic() - self._last_save >= self.save_interval:
+            self.save(self.path)
+        return new_rows
+
+    def save(self, path):
+        self._last_save = time.monotonic()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            state = {
+                "scaler": self.scaler,
+                "iso_forest": self.iso_forest,
+                "autoencoder_weights": self.autoencoder_weights,
+                "threshold": self.threshold,
+                "anomalies": self.anomalies,
+                "last_bill_id": self.last_bill_id,
+                "reservoir": self.reservoir,
+                "rows_seen": self.rows_seen,
+                "rng": self._rng
+            }
+        # Write to a temp file first so a crash never leaves a truncated model behind
+        tmp_path = path + ".tmp"
+        joblib.dump(state, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, products_df, save_interval=300, reservoir_size=50000, warm_start_epochs=5):
+        """Load saved models, or return an unfitted detector if there are none"""
+        detector = cls(products_df, path=path, save_interval=save_interval,
+                       reservoir_size=reservoir_size, warm_start_epochs=warm_start_epochs)
+        if not os.path.exists(path):
+            return detector
+        try:
+            state = joblib.load(path)
+        except Exception:
+            # Corrupt or incompatible pickle, retrain from scratch
+            return detector
+
+        detector.scaler = state["scaler"]
+        detector.iso_forest = state["iso_forest"]
+        detector.autoencoder_weights = state["autoencoder_weights"]
+        detector.threshold = state["threshold"]
+        detector.anomalies = state["anomalies"]
+        detector.last_bill_id = state["last_bill_id"]
+        detector.reservoir = state["reservoir"]
+        detector.rows_seen = state["rows_seen"]
+        detector._rng = state["rng"]
+        detector._publish()
+        return detector
 
     def build_autoencoder(self):
+        # TensorFlow is only imported when the autoencoder has to be trained
+        from keras.models import Model
+        from keras.layers import Input, Dense
+        from keras import regularizers
+
         input_dim = 3  # Number of features
         encoding_dim = 2  # Compressed representation size
 
@@ -71,44 +326,144 @@ class FraudDetection:
         autoencoder.compile(optimizer='adam', loss='mse')
         return autoencoder
 
+    def reconstruct(self, X_scaled, weights=None):
+        """NumPy forward pass of the fitted autoencoder (relu encoder, linear decoder)"""
+        encoder_kernel, encoder_bias, decoder_kernel, decoder_bias = weights or self.autoencoder_weights
+        encoded = np.maximum(X_scaled @ encoder_kernel + encoder_bias, 0.0)
+        return encoded @ decoder_kernel + decoder_bias
+
+    def reconstruction_errors(self, X_scaled, weights=None):
+        """Per-row autoencoder MSE, NaN when the models were fitted without Keras"""
+        weights = weights or self.autoencoder_weights
+        if weights is None:
+            return np.full(len(X_scaled), np.nan)
+        return np.mean(np.power(X_scaled - self.reconstruct(X_scaled, weights), 2), axis=1)
+
     def detect_anomaly(self, new_bill_record):
+        """Score one bill in real time (historical anomalies are served by get_all_anomalies)"""
+        mean, scale, iso_forest, iso_scorer, weights, threshold = self._models
+
         # Retrieve product information using the sku from the new bill record.
-        sku_value = new_bill_record["sku"]
-        product_info = self.products_df[self.products_df["sku"] == sku_value]
-        if product_info.empty:
-            raise ValueError("SKU not found in the products data.")
+        product_price = self.prices.get(new_bill_record["sku"])
+        if product_price is None:
+            raise ValueError(UNKNOWN_SKU_ERROR)
 
-        # Get the product price and compute expected_total.
-        product_price = product_info.iloc[0]["price"]
+        # Compute expected_total from the product price and the bill's quantity.
         quantity = new_bill_record["quantity"]
         total_amount = new_bill_record["total_amount"]
         expected_total = product_price * quantity
         difference = total_amount - expected_total
 
-        # Create a feature vector.
-        features_new = np.array([[quantity, total_amount, difference]])
-        features_new_scaled = self.scaler.transform(features_new)
+        # Create a scaled feature vector.
+        features_new = np.array([quantity, total_amount, difference], dtype=float)
+        features_new_scaled = (features_new - mean) / scale
 
-        # Isolation Forest detection.
-        iso_score = self.iso_forest.decision_function(features_new_scaled)[0]
-        iso_pred = self.iso_forest.predict(features_new_scaled)[0]  # 1 for normal, -1 for anomaly
+        # Isolation Forest detection, one pass over the trees gives score and prediction.
+        iso_score = iso_scorer.decision_function(features_new_scaled)
+        iso_pred = -1 if iso_score < 0 else 1  # 1 for normal, -1 for anomaly
 
-        # Autoencoder reconstruction error.
-        reconstruction = self.autoencoder.predict(features_new_scaled)
-        auto_error = np.mean(np.power(features_new_scaled - reconstruction, 2))
+        # Autoencoder reconstruction error, None without an autoencoder.
+        auto_error = None
+        if weights is not None:
+            reconstruction = self.reconstruct(features_new_scaled, weights)
+            auto_error = float(np.mean(np.power(features_new_scaled - reconstruction, 2)))
 
         # Flag as anomaly if either model indicates an issue.
-        is_anomaly = (iso_pred == -1) or (auto_error > self.threshold)
+        is_anomaly = bool(iso_pred == -1 or (auto_error is not None and auto_error > threshold))
 
         return {
             "iso_score": iso_score,
             "iso_prediction": iso_pred,
             "autoencoder_error": auto_error,
-            "is_anomaly": is_anomaly,
-            "anomalous_transactions": self.get_all_anomalies()
+            "is_anomaly": is_anomaly
         }
 
-    def get_all_anomalies(self):
-        """Get all transactions flagged as anomalous from historical data."""
-        return self.data_df[self.data_df["anomaly_flag"]].to_dict('records')
+    def score_bills(self, bill_records):
+        """Score a batch of bills with one IsolationForest and one autoencoder pass.
+
+        Returns one result per record, in order, with an "error" entry instead
+        for records that cannot be scored.
+        """
+        mean, scale, iso_forest, iso_scorer, weights, threshold = self._models
+
+        results = [None] * len(bill_records)
+        rows, features = [], []
+        for i, record in enumerate(bill_records):
+            try:
+                product_price = self.prices.get(record["sku"])
+                quantity = float(record["quantity"])
+                total_amount = float(record["total_amount"])
+            except KeyError as e:
+                results[i] = {"error": f"Missing field {e}"}
+                continue
+            except (TypeError, ValueError):
+                results[i] = {"error": "Invalid bill record."}
+                continue
+            if product_price is None:
+                results[i] = {"error": UNKNOWN_SKU_ERROR}
+                continue
+            rows.append(i)
+            features.append([quantity, total_amount, total_amount - product_price * quantity])
+
+        if not rows:
+            return results
 
+        X_scaled = (np.array(features) - mean) / scale
+        if len(rows) <= SCORER_MAX_ROWS:
+            iso_scores = [iso_scorer.decision_function(x) for x in X_scaled]
+        else:
+            iso_scores = iso_forest.decision_function(X_scaled).tolist()
+        if weights is not None:
+            auto_errors = self.reconstruction_errors(X_scaled, weights).tolist()
+        else:
+            auto_errors = [None] * len(rows)
+
+        for i, iso_score, auto_error in zip(rows, iso_scores, auto_errors):
+            iso_pred = -1 if iso_score < 0 else 1
+            results[i] = {
+                "iso_score": iso_score,
+                "iso_prediction": iso_pred,
+                "autoencoder_error": auto_error,
+                "is_anomaly": bool(iso_pred == -1 or (auto_error is not None and auto_error > threshold))
+            }
+        return results
+
+    def get_all_anomalies(self, limit=None, offset=0):
+        """Get transactions flagged as anomalous from historical data, a page at a time."""
+        end = offset + limit if limit is not None else None
+        page = self.anomalies.iloc[offset:end]
+        # Mongo ids of the merged bill and product (_id_x, _id_y) as strings
+        ids = [column for column in page.columns if column.startswith("_id")]
+        page = page.assign(**{column: page[column].astype(str) for column in ids})
+        return page.to_dict('records')
+
+    def _sample(self, X):
+        """Fold feature rows into the reservoir sample (Algorithm R, vectorized)"""
+        if self.reservoir is None:
+            self.reservoir = X[:self.reservoir_size].astype(float)
+            X = X[self.reservoir_size:]
+            self.rows_seen = len(self.reservoir)
+        if len(X) == 0:
+            return
+        if len(self.reservoir) < self.reservoir_size:
+            room = self.reservoir_size - len(self.reservoir)
+            self.reservoir = np.vstack([self.reservoir, X[:room]])
+            self.rows_seen += len(X[:room])
+            X = X[room:]
+        if len(X) == 0:
+            return
+
+        # Row t (1-based over everything seen) replaces a random slot with probability size / t;
+        # later rows win duplicate slots, as they would when applied one by one
+        positions = self.rows_seen + np.arange(1, len(X) + 1)
+        slots = (self._rng.random(len(X)) * positions).astype(np.int64)
+        accepted = slots < self.reservoir_size
+        self.reservoir[slots[accepted]] = X[accepted]
+        self.rows_seen += len(X)
+
+    def _publish(self):
+        # Everything the scoring paths read, swapped in as one tuple
+        self._models = (
+            self.scaler.mean_, self.scaler.scale_, self.iso_forest,
+            IsolationForestScorer(self.iso_forest), self.autoencoder_weights, self.threshold
+        )
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Fields each analysis actually reads from the bills collection
+BILL_FIELDS = {
+    'customer': ['billNumber', 'productSku', 'quantity', 'totalAmount', 'vendorName', 'paymentType', 'createdAt', 'Date'],
+    'recommendation': ['billNumber', 'productSku', 'quantity', 'totalAmount', 'createdAt'],
+    'fraud': ['billNumber', 'productSku', 'quantity', 'totalAmount', 'vendorName', 'createdAt']
+}
+PRODUCT_FIELDS = ['name', 'sku', 'stock', 'lowStockThreshold', 'price', 'category', 'manufacturing_date', 'expiry_date']
+MARKET_DEMAND_FIELDS = ['product_sku', 'market_demand_score']
+SUPPLIER_FIELDS = ['supplierName', 'sku', 'price', 'stock', 'supplyFrequency']
+
+# Column types applied while loading. Low-cardinality strings become categories
+# and dates datetime64. Bill measures stay float64: their means and sums are
+# returned by the API and feed the models, float32 rounding would show up there.
+BILL_DTYPES = {
+    'productSku': 'category',
+    'vendorName': 'category',
+    'paymentType': 'category',
+    'quantity': np.float64,
+    'totalAmount': np.float64,
+    'createdAt': 'datetime64[ns]',
+    'Date': 'datetime64[ns]'
+}
+PRODUCT_DTYPES = {
+    'category': 'category',
+    'manufacturing_date': 'datetime64[ns]',
+    'expiry_date': 'datetime64[ns]'
+}
+MARKET_DEMAND_DTYPES = {
+    'market_demand_score': np.float32
+}
+
+
+def bill_fields(*analyses):
+    """Union of the bill fields needed by the given analyses (all of them by default)"""
+    fields = []
+    for analysis in analyses or BILL_FIELDS:
+        fields += [field for field in BILL_FIELDS[analysis] if field not in fields]
+    return fields
+
+
+def load_frame(collection, fields=None, dtypes=None, query=None, batch_size=50000, use_arrow=True):
+    """Load a projected collection into a typed DataFrame.
+
+    Documents are converted in chunks of batch_size so only one chunk of raw
+    dicts is alive at a time. When pymongoarrow is installed it is used for
+    the bulk conversion instead.
+    """
+    projection = {field: 1 for field in fields} if fields else None
+    # _id is always kept, the snapshot uses it as a watermark
+    if projection is not None:
+        projection['_id'] = 1
+
+    if use_arrow:
+        try:
+            from pymongoarrow.api import find_pandas_all
+        except ImportError:
+            pass
+        else:
+            frame = find_pandas_all(collection, query or {}, projection=projection, sort=[('_id', 1)])
+            return apply_dtypes(frame, dtypes)
+
+    cursor = collection.find(query or {}, projection).sort('_id', 1).batch_size(batch_size)
+    chunks, batch = [], []
+    for document in cursor:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            chunks.append(apply_dtypes(pd.DataFrame(batch), dtypes))
+            batch = []
+    if batch or not chunks:
+        chunks.append(apply_dtypes(pd.DataFrame(batch), dtypes))
+
+    return concat_frames(chunks)
+
+
+def load_bills(collection, *analyses, query=None, batch_size=50000):
+    return load_frame(collection, bill_fields(*analyses), BILL_DTYPES, query, batch_size)
+
+
+def load_products(collection, query=None):
+    return load_frame(collection, PRODUCT_FIELDS, PRODUCT_DTYPES, query)
+
+
+def load_market_demand(collection, query=None):
+    return load_frame(collection, MARKET_DEMAND_FIELDS, MARKET_DEMAND_DTYPES, query)
+
+
+def load_suppliers(collection, query=None):
+    return load_frame(collection, SUPPLIER_FIELDS, None, query)
+
+
+def apply_dtypes(frame, dtypes):
+    if not dtypes or frame.empty:
+        return frame
+    for column, dtype in dtypes.items():
+        if column not in frame.columns:
+            continue
+        if dtype == 'datetime64[ns]':
+            frame[column] = pd.to_datetime(frame[column], errors='coerce')
+        elif dtype == 'category':
+            frame[column] = frame[column].astype('category')
+        else:
+            frame[column] = pd.to_numeric(frame[column], errors='coerce').astype(dtype)
+    return frame
+
+
+def concat_frames(frames):
+    """Concatenate frames, unioning categories so categorical columns stay categorical"""
+    frames = [frame for frame in frames if not frame.empty] or frames[:1]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+
+    categorical = [
+        column for column in frames[0].columns
+        if isinstance(frames[0][column].dtype, pd.CategoricalDtype)
+        and all(column in frame.columns and isinstance(frame[column].dtype, pd.CategoricalDtype) for frame in frames)
+    ]
+    for column in categorical:
+        categories = union_categoricals([frame[column] for frame in frames]).categories
+        frames = [frame.assign(**{column: frame[column].cat.set_categories(categories)}) for frame in frames]
+
+    return pd.concat(frames, ignore_index=True)
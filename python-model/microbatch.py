@@ -0,0 +1,73 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    def __init__(self, score_fn, max_batch=512, max_wait_ms=10):
+        """Coalesce concurrent scoring requests into batches for score_fn.
+
+        A batch is flushed once it holds max_batch rows or max_wait_ms after its
+        first request arrived, whichever comes first. score_fn takes a list of
+        rows and returns one result per row in the same order.
+        """
+        self.score_fn = score_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, rows):
+        """Queue rows for scoring, returning a Future of their results"""
+        future = Future()
+        if not rows:
+            future.set_result([])
+            return future
+        self._ensure_started()
+        self._queue.put((list(rows), future))
+        return future
+
+    def score(self, rows, timeout=None):
+        return self.submit(rows).result(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            n_rows = len(pending[0][0])
+            deadline = time.monotonic() + self.max_wait
+
+            # Keep collecting requests until the batch is full or the wait is over
+            while n_rows < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(request)
+                n_rows += len(request[0])
+
+            batch = [row for rows, _ in pending for row in rows]
+            try:
+                results = self.score_fn(batch)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+
+            start = 0
+            for rows, future in pending:
+                future.set_result(results[start:start + len(rows)])
+                start += len(rows)
@@ -1,11 +1,18 @@
 import random
 import pandas as pd
 import numpy as np
+from scipy import sparse
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import LabelEncoder
 from datetime import datetime, timedelta
 from sklearn.metrics.pairwise import cosine_similarity
+from recommendation_index import RecommendationIndex
+
+DEMAND_FEATURES = [
+    'total_quantity', 'avg_quantity', 'total_revenue', 
+    'avg_revenue', 'current_stock', 'price', 'market_demand_score'
+]
 
 
 class ComprehensiveRecommendationModel:
@@ -36,12 +43,13 @@ class ComprehensiveRecommendationModel:
 
         return merged_data
 
-    def generate_comprehensive_recommendations(self):
+    def build_product_metrics(self):
+        """Aggregate bills into one row of demand features per product"""
         # Preprocess data
         processed_data = self.preprocess_data()
 
         # Aggregate product-level metrics
-        product_metrics = processed_data.groupby('productSku').agg({
+        product_metrics = processed_data.groupby('productSku', observed=True).agg({
             'quantity': ['sum', 'mean'],
             'totalAmount': ['sum', 'mean'],
             'name': 'first',
@@ -58,17 +66,19 @@ class ComprehensiveRecommendationModel:
 
         # Add market demand score if available
         if 'market_demand_score' in processed_data.columns:
-            market_demand = processed_data.groupby('productSku')['market_demand_score'].mean()
+            market_demand = processed_data.groupby('productSku', observed=True)['market_demand_score'].mean()
             product_metrics['market_demand_score'] = product_metrics['sku'].map(market_demand)
         else:
             product_metrics['market_demand_score'] = [random.randint(25, 95) for _ in range(len(product_metrics))]
 
-        # Predict future demand
-        features = [
-            'total_quantity', 'avg_quantity', 'total_revenue', 
-            'avg_revenue', 'current_stock', 'price', 'market_demand_score'
-        ]
-        X = product_metrics[features]
+        return product_metrics
+
+    def train_demand_model(self, product_metrics=None):
+        """Fit the demand forecasting model on product-level metrics"""
+        if product_metrics is None:
+            product_metrics = self.build_product_metrics()
+
+        X = product_metrics[DEMAND_FEATURES]
         y = product_metrics['total_quantity']
 
         # Split and train model
@@ -76,147 +86,161 @@ class ComprehensiveRecommendationModel:
         demand_model = RandomForestRegressor(n_estimators=100, random_state=42)
         demand_model.fit(X_train, y_train)
 
-        # Generate recommendations
-        recommendations = []
-        for _, product in product_metrics.iterrows():
-            # Predict future demand
-            predicted_demand = demand_model.predict([
-                [product['total_quantity'], product['avg_quantity'], 
-                 product['total_revenue'], product['avg_revenue'], 
-                 product['current_stock'], product['price'], 
-                 product['market_demand_score']]
-            ])[0]
-
-            # Calculate recommended stock
-            recommended_stock = max(
-                product['low_stock_threshold'] * 3,
-                int(predicted_demand * 1.5)
-            )
+        return demand_model
 
-            # Determine risk level
-            risk_level = self._calculate_risk_level(
-                product['current_stock'], 
-                recommended_stock, 
-                product['market_demand_score']
-            )
+    def generate_comprehensive_recommendations(self, demand_model=None):
+        product_metrics = self.build_product_metrics()
 
-            # Generate monthly predictions
-            monthly_predictions = []
-            current_date = datetime.now()
-            for i in range(6):  # Next 6 months
-                month_date = current_date + timedelta(days=30*i)
-                monthly_predictions.append({
-                    'month': month_date.strftime('%B'),
-                    'predicted_sales': round(predicted_demand * (1 + random.uniform(-0.2, 0.2))),
-                    'actual_sales': round(product['avg_quantity'] * (1 + random.uniform(-0.1, 0.1)))
-                })
-
-            # Generate yearly trend
-            yearly_trend = []
-            current_year = datetime.now().year
-            for i in range(3):  # Past 3 years
-                year = current_year - i
-                yearly_trend.append({
-                    'year': str(year),
-                    'demand_index': round(random.uniform(5, 9), 2)
-                })
-
-            recommendations.append({
-                'sku': product['sku'],
-                'name': product['name'],
-                'category': product['category'],
-                'current_stock': product['current_stock'],
-                'predicted_demand': predicted_demand,
-                'recommended_stock': recommended_stock,
-                'risk_level': risk_level,
-                'market_demand_score': product['market_demand_score'],
-                'price': product['price'],
-                'monthly_predictions': monthly_predictions,
-                'yearly_trend': yearly_trend
-            })
+        # Predict future demand, reusing a pre-trained model when one is given
+        if demand_model is None:
+            demand_model = self.train_demand_model(product_metrics)
+
+        # Predict future demand for the whole feature matrix in one call
+        predicted_demand = demand_model.predict(product_metrics[DEMAND_FEATURES])
+
+        # Calculate recommended stock
+        low_stock_threshold = product_metrics['low_stock_threshold'].to_numpy()
+        recommended_stock = np.maximum(
+            low_stock_threshold * 3,
+            (predicted_demand * 1.5).astype(int)
+        )
+
+        # Determine risk level
+        risk_level = self._calculate_risk_levels(
+            product_metrics['current_stock'].to_numpy(),
+            recommended_stock,
+            product_metrics['market_demand_score'].to_numpy()
+        )
+
+        # Generate monthly predictions for the next 6 months
+        n_products = len(product_metrics)
+        current_date = datetime.now()
+        months = [(current_date + timedelta(days=30*i)).strftime('%B') for i in range(6)]
+        predicted_sales = np.rint(
+            predicted_demand[:, None] * (1 + np.random.uniform(-0.2, 0.2, (n_products, 6)))
+        ).astype(int).tolist()
+        actual_sales = np.rint(
+            product_metrics['avg_quantity'].to_numpy()[:, None] * (1 + np.random.uniform(-0.1, 0.1, (n_products, 6)))
+        ).astype(int).tolist()
+
+        # Generate yearly trend for the past 3 years
+        current_year = datetime.now().year
+        years = [str(current_year - i) for i in range(3)]
+        demand_index = np.round(np.random.uniform(5, 9, (n_products, 3)), 2).tolist()
+
+        # Build output records from the columnar arrays
+        columns = zip(
+            product_metrics['sku'].tolist(),
+            product_metrics['name'].tolist(),
+            product_metrics['category'].tolist(),
+            product_metrics['current_stock'].tolist(),
+            predicted_demand.tolist(),
+            recommended_stock.tolist(),
+            risk_level.tolist(),
+            product_metrics['market_demand_score'].tolist(),
+            product_metrics['price'].tolist(),
+            predicted_sales,
+            actual_sales,
+            demand_index
+        )
+        recommendations = [
+            {
+                'sku': sku,
+                'name': name,
+                'category': category,
+                'current_stock': current_stock,
+                'predicted_demand': predicted,
+                'recommended_stock': recommended,
+                'risk_level': risk,
+                'market_demand_score': market_demand_score,
+                'price': price,
+                'monthly_predictions': [
+                    {'month': month, 'predicted_sales': p, 'actual_sales': a}
+                    for month, p, a in zip(months, predicted_row, actual_row)
+                ],
+                'yearly_trend': [
+                    {'year': year, 'demand_index': d}
+                    for year, d in zip(years, index_row)
+                ]
+            }
+            for (sku, name, category, current_stock, predicted, recommended, risk,
+                 market_demand_score, price, predicted_row, actual_row, index_row) in columns
+        ]
 
         return sorted(recommendations, key=lambda x: x['risk_level'], reverse=True)
 
-    def get_product_recommendation(self, sku):
-        # Get all recommendations
-        all_recommendations = self.generate_comprehensive_recommendations()
-        
-        # Find specific product recommendation
-        product_rec = next((rec for rec in all_recommendations if rec['sku'] == sku), None)
-        
-        if product_rec:
-            # Get similar products based on category and price range
-            similar_products = [
-                rec for rec in all_recommendations 
-                if rec['sku'] != sku 
-                and rec['category'] == product_rec['category']
-                and 0.7 * product_rec['price'] <= rec['price'] <= 1.3 * product_rec['price']
-            ][:3]
-            
-            # Add similar products to recommendation
-            product_rec['similar_products'] = similar_products
-            
-            return product_rec
-        return None
-
-    def _calculate_risk_level(self, current_stock, recommended_stock, market_demand):
+    def get_product_recommendation(self, sku, demand_model=None):
+        # Index all recommendations by SKU and category/price
+        index = RecommendationIndex(self.generate_comprehensive_recommendations(demand_model))
+
+        # Specific product with up to 3 similar products by category and price range
+        return index.get_with_similar(sku)
+
+    def _calculate_risk_levels(self, current_stock, recommended_stock, market_demand):
         # Calculate stock risk based on current stock, recommended stock, and market demand
-        stock_ratio = current_stock / recommended_stock if recommended_stock > 0 else 0
-        
+        stock_ratio = np.divide(
+            current_stock, recommended_stock,
+            out=np.zeros(len(current_stock), dtype=float),
+            where=recommended_stock > 0
+        )
+
         # Risk calculation considers stock levels and market demand
-        if stock_ratio < 0.3:
-            return 'HIGH'
-        elif stock_ratio < 0.6:
-            return 'MEDIUM'
-        elif market_demand > 70:
-            return 'LOW-WATCH'
-        else:
-            return 'LOW'
+        return np.select(
+            [stock_ratio < 0.3, stock_ratio < 0.6, market_demand > 70],
+            ['HIGH', 'MEDIUM', 'LOW-WATCH'],
+            default='LOW'
+        )
 
     def recommend_product_bundles(self, min_support=0.01, min_confidence=0.3):
-        # Get processed data
-        processed_data = self.preprocess_data()
-        
-        # Create a transaction matrix
-        transactions = processed_data.groupby(['billNumber'])['productSku'].agg(list).values.tolist()
-        
-        # Calculate product co-occurrence matrix
-        product_pairs = []
-        for transaction in transactions:
-            for i in range(len(transaction)):
-                for j in range(i + 1, len(transaction)):
-                    product_pairs.append((transaction[i], transaction[j]))
-        
-        # Convert to DataFrame and get counts
-        pair_counts = pd.DataFrame(product_pairs, columns=['product1', 'product2']).value_counts()
-        
-        # Calculate support and confidence
-        total_transactions = len(transactions)
+        # Only bill lines for known products take part in bundles
+        product_details = self.products_data.drop_duplicates('sku').set_index('sku')
+        lines = self.bills_data[self.bills_data['productSku'].isin(product_details.index)]
+        if lines.empty:
+            return []
+
+        # Sparse basket-by-SKU matrix, one row per bill
+        basket_codes, bill_numbers = pd.factorize(lines['billNumber'])
+        sku_codes, skus = pd.factorize(lines['productSku'])
+        total_transactions = len(bill_numbers)
+        baskets = sparse.csr_matrix(
+            (np.ones(len(lines), dtype=np.int32), (basket_codes, sku_codes)),
+            shape=(total_transactions, len(skus))
+        )
+        # Collapse repeated lines of the same SKU within a bill
+        baskets.data[:] = 1
+
+        # Single-item supports, pruning items that cannot reach min_support in any pair
+        item_counts = np.asarray(baskets.sum(axis=0)).ravel()
+        frequent = np.flatnonzero(item_counts >= min_support * total_transactions)
+        if len(frequent) < 2:
+            return []
+        baskets = baskets[:, frequent]
+        item_counts = item_counts[frequent]
+        skus = skus[frequent]
+
+        # Pair counts via sparse matrix product, keeping each unordered pair once
+        pair_counts = sparse.triu(baskets.T @ baskets, k=1).tocoo()
+        support = pair_counts.data / total_transactions
+        conf1 = pair_counts.data / item_counts[pair_counts.row]
+        conf2 = pair_counts.data / item_counts[pair_counts.col]
+        keep = (support >= min_support) & ((conf1 >= min_confidence) | (conf2 >= min_confidence))
+
+        names = product_details['name'].to_dict()
+        prices = product_details['price'].to_dict()
+
         bundles = []
-        
-        for (prod1, prod2), count in pair_counts.items():
-            support = count / total_transactions
-            if support >= min_support:
-                # Calculate confidence both ways
-                prod1_count = sum(1 for t in transactions if prod1 in t)
-                prod2_count = sum(1 for t in transactions if prod2 in t)
-                
-                conf1 = count / prod1_count
-                conf2 = count / prod2_count
-                
-                if conf1 >= min_confidence or conf2 >= min_confidence:
-                    prod1_details = self.products_data[self.products_data['sku'] == prod1].iloc[0]
-                    prod2_details = self.products_data[self.products_data['sku'] == prod2].iloc[0]
-                    
-                    bundles.append({
-                        'products': [
-                            {'sku': prod1, 'name': prod1_details['name']},
-                            {'sku': prod2, 'name': prod2_details['name']}
-                        ],
-                        'support': support,
-                        'confidence': max(conf1, conf2),
-                        'bundle_price': float(prod1_details['price'] + prod2_details['price']),
-                        'suggested_discount': 0.1  # 10% discount for bundles
-                    })
-        
-        return sorted(bundles, key=lambda x: x['confidence'], reverse=True)
\ No newline at end of file
+        for i, j, pair_support, c1, c2 in zip(pair_counts.row[keep], pair_counts.col[keep],
+                                              support[keep], conf1[keep], conf2[keep]):
+            prod1, prod2 = skus[i], skus[j]
+            bundles.append({
+                'products': [
+                    {'sku': prod1, 'name': names[prod1]},
+                    {'sku': prod2, 'name': names[prod2]}
+                ],
+                'support': float(pair_support),
+                'confidence': float(max(c1, c2)),
+                'bundle_price': float(prices[prod1] + prices[prod2]),
+                'suggested_discount': 0.1  # 10% discount for bundles
+            })
+
+        return sorted(bundles, key=lambda x: x['confidence'], reverse=True)
@@ -0,0 +1,106 @@
+from datetime import date
+
+import numpy as np
+
+
+class QueryError(ValueError):
+    """Invalid query parameter, reported to the client as a 400"""
+
+
+def page_params(args, sort_fields=()):
+    """offset, limit, sort field and order from the request arguments"""
+    offset = int_param(args, 'offset', 0)
+    limit = int_param(args, 'limit')
+
+    sort = args.get('sort')
+    if sort is not None and sort not in sort_fields:
+        raise QueryError(f'sort must be one of {", ".join(sort_fields)}')
+    order = args.get('order', 'desc')
+    if order not in ('asc', 'desc'):
+        raise QueryError('order must be asc or desc')
+    return offset, limit, sort, order == 'desc'
+
+
+def int_param(args, name, default=None):
+    """Non-negative integer query parameter, QueryError when it does not parse"""
+    value = args.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        value = -1
+    if value < 0:
+        raise QueryError(f'{name} must be a non-negative integer')
+    return value
+
+
+def float_param(args, name, default=None):
+    """Float query parameter, QueryError rather than the default when it does not parse"""
+    value = args.get(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise QueryError(f'{name} must be a number')
+
+
+def date_param(args, name, default=None):
+    """ISO date (YYYY-MM-DD) query parameter, QueryError when it does not parse"""
+    value = args.get(name)
+    if value is None:
+        return default
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise QueryError(f'{name} must be a date in YYYY-MM-DD format')
+
+
+def top_k(values, k, descending=True):
+    """Indices of the k largest (or smallest) values in order, without sorting everything.
+
+    Ties keep their original order. NaN sorts last either way.
+    """
+    values = np.asarray(values, dtype=float)
+    keys = -values if descending else values
+    if k is None or k >= len(keys):
+        return np.argsort(keys, kind='stable')
+    if k <= 0:
+        return np.array([], dtype=np.int64)
+    # argpartition finds the k-th best value in O(n), only the k rows up to it get sorted
+    kth = keys[np.argpartition(keys, k - 1)[k - 1]]
+    if np.isnan(kth):
+        better = np.flatnonzero(~np.isnan(keys))
+        tied = np.flatnonzero(np.isnan(keys))
+    else:
+        better = np.flatnonzero(keys < kth)
+        tied = np.flatnonzero(keys == kth)
+    # Ties at the cut-off go to the earliest rows, as with a stable full sort
+    candidates = np.concatenate([better, tied[:k - len(better)]])
+    return candidates[np.lexsort((candidates, keys[candidates]))]
+
+
+def _window(offset, limit):
+    return None if limit is None else offset + limit
+
+
+def paginate_records(records, offset=0, limit=None, sort=None, descending=True):
+    """Page of a list of dicts, optionally top-K by a numeric field. Returns (page, total)."""
+    total = len(records)
+    if sort is None:
+        return records[offset:_window(offset, limit)], total
+    values = [record.get(sort) for record in records]
+    values = [np.nan if value is None else value for value in values]
+    selected = top_k(values, _window(offset, limit), descending)[offset:]
+    return [records[i] for i in selected], total
+
+
+def paginate_frame(frame, offset=0, limit=None, sort=None, descending=True):
+    """Page of a DataFrame (or Series), optionally top-K by a column. Returns (page, total)."""
+    total = len(frame)
+    if sort is None:
+        return frame.iloc[offset:_window(offset, limit)], total
+    values = frame[sort] if sort in getattr(frame, 'columns', ()) else frame
+    selected = top_k(values.to_numpy(dtype=float), _window(offset, limit), descending)[offset:]
+    return frame.iloc[selected], total
@@ -0,0 +1,58 @@
+import heapq
+from bisect import bisect_left, bisect_right
+
+
+class RecommendationIndex:
+    def __init__(self, recommendations=(), key=None):
+        """Materialized recommendations keyed by SKU with a per-category price index.
+
+        Readers do not lock, so an index is never updated once built: build a new
+        one (key e.g. snapshot and model version) and swap the reference.
+        """
+        self.key = key
+        self._by_sku = {rec['sku']: rec for rec in recommendations}
+
+        # Keep the incoming order (risk level) for listing and tie-breaking
+        self._ordered = list(self._by_sku.values())
+        self._rank = {rec['sku']: i for i, rec in enumerate(self._ordered)}
+        self._ordered_by_category = {}
+        self._by_category = {}
+        for rec in self._ordered:
+            self._ordered_by_category.setdefault(rec['category'], []).append(rec)
+            self._by_category.setdefault(rec['category'], []).append((rec['price'], rec['sku']))
+        for entries in self._by_category.values():
+            entries.sort()
+
+    def all(self):
+        return self._ordered
+
+    def query(self, category=None, risk_level=None):
+        """Recommendations in listing order, optionally only one category and/or risk level"""
+        recs = self._ordered if category is None else self._ordered_by_category.get(category, [])
+        if risk_level is not None:
+            recs = [rec for rec in recs if rec['risk_level'] == risk_level]
+        return recs
+
+    def get(self, sku):
+        return self._by_sku.get(sku)
+
+    def similar(self, sku, limit=3, price_range=0.3):
+        """Products in the same category priced within +/- price_range of the given SKU"""
+        rec = self._by_sku.get(sku)
+        if rec is None:
+            return []
+
+        entries = self._by_category.get(rec['category'], [])
+        low = bisect_left(entries, ((1 - price_range) * rec['price'], ''))
+        high = bisect_right(entries, ((1 + price_range) * rec['price'], '\uffff'))
+
+        candidates = [other for _, other in entries[low:high] if other != sku]
+        best = heapq.nsmallest(limit, candidates, key=self._rank.__getitem__)
+        return [self._by_sku[other] for other in best]
+
+    def get_with_similar(self, sku, limit=3):
+        """Recommendation for a SKU with its similar products attached"""
+        rec = self._by_sku.get(sku)
+        if rec is None:
+            return None
+        return dict(rec, similar_products=self.similar(sku, limit))
@@ -0,0 +1,162 @@
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime
+
+import joblib
+import pandas as pd
+
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+
+
+def data_fingerprint(data):
+    """Content hash of a snapshot that stays stable across restarts"""
+    digest = hashlib.sha1()
+
+    # Size and last _id identify the appended bills, the content hash catches edits
+    # to existing ones (e.g. amounts or payment types). _id itself is left out of
+    # the content hash, hashing ObjectIds means converting each one to a string.
+    digest.update(str(len(data.bills)).encode())
+    if not data.bills.empty:
+        digest.update(str(data.bills['_id'].iloc[-1]).encode())
+        content = data.bills.drop(columns='_id', errors='ignore')
+        digest.update(pd.util.hash_pandas_object(content, index=False).values.tobytes())
+
+    # Catalogue collections are small enough to hash in full
+    for frame in (data.products, data.market_demand):
+        digest.update(str(len(frame)).encode())
+        if not frame.empty:
+            hashed = pd.util.hash_pandas_object(frame.astype(str), index=False)
+            digest.update(hashed.values.tobytes())
+
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    def __init__(self, snapshot, model_dir=DEFAULT_MODEL_DIR, retrain_interval=300):
+        """Train models once, persist them with joblib and serve the fitted estimators"""
+        self.snapshot = snapshot
+        self.model_dir = model_dir
+        self.retrain_interval = retrain_interval
+
+        self._trainers = {}
+        self._entries = {}
+        self._training = set()
+        self._lock = threading.Lock()
+        self._fingerprint = (None, None)
+
+    def register(self, name, train_fn):
+        """Register a trainer taking a Snapshot and returning a fitted model"""
+        # The persisted model is loaded on first use to keep startup cheap
+        self._trainers[name] = train_fn
+
+    def get(self, name, data=None):
+        """Return the fitted model, retraining in the background if the data has moved on"""
+        return self.get_entry(name, data)['model']
+
+    def get_entry(self, name, data=None):
+        """Like get(), but the whole entry so the model and its version always match"""
+        data = data if data is not None else self.snapshot.get()
+        data_hash = self.fingerprint(data)
+        entry = self._entry(name)
+
+        # Nothing to serve yet, so the first caller has to wait for training
+        if entry is None:
+            return self.train(name, data, data_hash)
+
+        if entry['data_hash'] != data_hash:
+            self._train_in_background(name, data, data_hash)
+        return entry
+
+    def info(self, name):
+        """Return the metadata of the currently served model"""
+        entry = self._entries.get(name)
+        if entry is None:
+            return None
+        return {key: value for key, value in entry.items() if key != 'model'}
+
+    def fingerprint(self, data):
+        # Hashing is memoized per in-process snapshot version
+        version, data_hash = self._fingerprint
+        if version != data.version or data_hash is None:
+            data_hash = data_fingerprint(data)
+            self._fingerprint = (data.version, data_hash)
+        return data_hash
+
+    def train(self, name, data, data_hash=None):
+        """Fit a model synchronously and persist it"""
+        data_hash = data_hash or self.fingerprint(data)
+        model = self._trainers[name](data)
+
+        previous = self._entries.get(name)
+        entry = {
+            'model': model,
+            'version': previous['version'] + 1 if previous else 1,
+            'data_hash': data_hash,
+            'trained_at': datetime.now().isoformat()
+        }
+        self._save(name, entry)
+        self._entries[name] = entry
+        return entry
+
+    def start(self):
+        """Retrain every registered model on a schedule when the snapshot changes"""
+        thread = threading.Thread(target=self._run_schedule, name='model-registry', daemon=True)
+        thread.start()
+        return thread
+
+    def _run_schedule(self):
+        while True:
+            time.sleep(self.retrain_interval)
+            data = self.snapshot.get()
+            data_hash = self.fingerprint(data)
+            for name in list(self._trainers):
+                # A model no request has used yet may still be current on disk
+                entry = self._entry(name)
+                if entry is None or entry['data_hash'] != data_hash:
+                    self._train_in_background(name, data, data_hash)
+
+    def _train_in_background(self, name, data, data_hash):
+        with self._lock:
+            if name in self._training:
+                return
+            self._training.add(name)
+
+        def run():
+            try:
+                self.train(name, data, data_hash)
+            finally:
+                with self._lock:
+                    self._training.discard(name)
+
+        threading.Thread(target=run, name=f'train-{name}', daemon=True).start()
+
+    def _entry(self, name):
+        """Served entry, loading the persisted one on first use"""
+        entry = self._entries.get(name)
+        if entry is None:
+            entry = self._load(name)
+            if entry is not None:
+                self._entries[name] = entry
+        return entry
+
+    def _path(self, name):
+        return os.path.join(self.model_dir, f'{name}.joblib')
+
+    def _save(self, name, entry):
+        os.makedirs(self.model_dir, exist_ok=True)
+        # Write to a temp file first so a crash never leaves a truncated model behind
+        tmp_path = self._path(name) + '.tmp'
+        joblib.dump(entry, tmp_path)
+        os.replace(tmp_path, self._path(name))
+
+    def _load(self, name):
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        try:
+            return joblib.load(path)
+        except Exception:
+            # Corrupt or incompatible pickle, retrain on next request
+            return None
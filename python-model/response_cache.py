@@ -0,0 +1,144 @@
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import joblib
+from flask import Response, make_response, request
+
+
+class ResponseCache:
+    def __init__(self, version_fn, max_entries=256, ttl=None, path=None):
+        """Cache of rendered GET responses keyed by path, query string and data version.
+
+        version_fn returns the current data version, so an entry is only reused
+        while the data it was computed from is unchanged. Entries are evicted
+        least recently used first beyond max_entries, and expire after ttl
+        seconds when one is given. With a path they are also written to disk
+        there and survive restarts.
+        """
+        self.version_fn = version_fn
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, key_fn=None):
+        """Decorator for a view, key_fn can add state the response depends on (e.g. a model version)"""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET':
+                    return view(*args, **kwargs)
+
+                key = repr((
+                    request.path,
+                    sorted(request.args.items(multi=True)),
+                    self.version_fn(),
+                    key_fn() if key_fn is not None else None
+                ))
+                entry = self.get(key)
+                if entry is None:
+                    response = make_response(view(*args, **kwargs))
+                    # Errors and 503s from busy analytics are never cached
+                    if response.status_code != 200:
+                        return response
+                    body = response.get_data()
+                    # Keep the view's own headers (e.g. X-Total-Count) with the body
+                    headers = [(name, value) for name, value in response.headers
+                               if name not in ('Content-Type', 'Content-Length')]
+                    entry = self.put(key, hashlib.sha1(body).hexdigest(), body, response.mimetype, headers)
+
+                etag, body, mimetype = entry['etag'], entry['body'], entry['mimetype']
+                headers = entry.get('headers')
+                # Weak ETags, the body is the same whatever Content-Encoding is applied later
+                if request.if_none_match.contains_weak(etag):
+                    response = Response(status=304)
+                else:
+                    response = Response(body, mimetype=mimetype, headers=headers)
+                response.set_etag(etag, weak=True)
+                return response
+            return wrapper
+        return decorator
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and self.path:
+            entry = self._read(key)
+            if entry is not None:
+                self._store(key, entry)
+
+        if entry is not None and self.ttl is not None and now - entry['created'] > self.ttl:
+            self._evict(key)
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def put(self, key, etag, body, mimetype, headers=None):
+        entry = {'etag': etag, 'body': body, 'mimetype': mimetype, 'headers': headers, 'created': time.time()}
+        self._store(key, entry)
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            # Write to a temp file first so readers never see a partial entry
+            tmp_path = self._file(key) + '.tmp'
+            joblib.dump((key, entry), tmp_path)
+            os.replace(tmp_path, self._file(key))
+        return entry
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._entries)
+        for key in keys:
+            self._evict(key)
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+        for key in evicted:
+            self._remove_file(key)
+
+    def _evict(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        self._remove_file(key)
+
+    def _file(self, key):
+        return os.path.join(self.path, hashlib.sha1(key.encode()).hexdigest() + '.joblib')
+
+    def _read(self, key):
+        path = self._file(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            stored_key, entry = joblib.load(path)
+        except Exception:
+            return None
+        # Guard against hash collisions
+        return entry if stored_key == key else None
+
+    def _remove_file(self, key):
+        if not self.path:
+            return
+        try:
+            os.remove(self._file(key))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,164 @@
+"""Fast response serialization for large analytics payloads.
+
+Payloads may hold DataFrames, Series and NumPy values directly. They are
+written with orjson when it is installed (NumPy arrays natively), otherwise
+with the standard json module. Clients can pick the layout of pandas objects
+with ?orient= (dict, the default, split or records) and ask for an Arrow IPC
+stream of the route's main table with ?format=arrow when pyarrow is installed.
+"""
+import datetime
+import gzip
+import io
+import json
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+from flask import Response, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_MIMETYPE = 'application/json'
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+ORIENTS = ('dict', 'split', 'records')
+
+# Responses smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _values(values):
+    """Array for orjson, plain list when orjson cannot take the dtype"""
+    values = np.asarray(values)
+    if orjson is not None and values.dtype.kind in 'biuf' and values.dtype != np.float16:
+        # orjson only serializes C-contiguous arrays
+        return np.ascontiguousarray(values)
+    return values.tolist()
+
+
+def _key(label):
+    # MultiIndex labels (e.g. from groupby().agg) become 'totalAmount_mean' style keys
+    return '_'.join(str(part) for part in label) if isinstance(label, tuple) else label
+
+
+def _labels(index):
+    if isinstance(index, pd.MultiIndex):
+        return [_key(label) for label in index]
+    return index.tolist()
+
+
+def convert_pandas(obj, orient='dict'):
+    """JSON-ready structure for a DataFrame or Series in the given orientation"""
+    if isinstance(obj, pd.Series):
+        if orient == 'split':
+            return {'name': obj.name, 'index': _labels(obj.index), 'data': _values(obj.to_numpy())}
+        if orient == 'records':
+            return [{'index': label, 'value': value} for label, value in zip(_labels(obj.index), obj.tolist())]
+        return dict(zip(_labels(obj.index), obj.tolist()))
+
+    if orient == 'split':
+        return {
+            'columns': [str(_key(column)) for column in obj.columns],
+            'index': _labels(obj.index),
+            'data': {str(_key(column)): _values(obj[column].to_numpy()) for column in obj.columns}
+        }
+    if orient == 'records':
+        return obj.set_axis(_labels(obj.columns), axis=1).to_dict('records')
+    return {_key(column): dict(zip(_labels(obj.index), obj[column].tolist())) for column in obj.columns}
+
+
+def encode(payload, orient='dict'):
+    """Serialize a payload that may contain pandas and NumPy objects to JSON bytes"""
+    def default(obj):
+        if isinstance(obj, (pd.DataFrame, pd.Series)):
+            return convert_pandas(obj, orient)
+        if isinstance(obj, ObjectId):
+            return str(obj)
+        if isinstance(obj, (set, frozenset)):
+            # Sorted so the body (and its ETag) is stable
+            return sorted(obj, key=str)
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            return obj.item()
+        if isinstance(obj, (pd.Timestamp, datetime.date)):
+            return obj.isoformat()
+        if obj is pd.NaT:
+            return None
+        raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+    if orjson is not None:
+        return orjson.dumps(payload, default=default, option=ORJSON_OPTIONS)
+    return json.dumps(payload, default=default, separators=(',', ':')).encode()
+
+
+def to_arrow(table):
+    """Arrow IPC stream bytes for a DataFrame or Series"""
+    import pyarrow as pa
+
+    if isinstance(table, pd.Series):
+        table = table.to_frame(table.name or 'value')
+    arrow_table = pa.Table.from_pandas(table, preserve_index=True)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, arrow_table.schema) as writer:
+        writer.write_table(arrow_table)
+    return sink.getvalue()
+
+
+def render(payload, table=None, status=200, headers=None):
+    """Response for payload in the layout the request asked for"""
+    if request.args.get('format') == 'arrow':
+        if table is None:
+            return Response(encode({'error': 'Arrow output is not available for this endpoint'}), 406, mimetype=JSON_MIMETYPE)
+        try:
+            return Response(to_arrow(table), status, headers, mimetype=ARROW_MIMETYPE)
+        except ImportError:
+            return Response(encode({'error': 'Arrow output requires pyarrow'}), 406, mimetype=JSON_MIMETYPE)
+
+    orient = request.args.get('orient', 'dict')
+    if orient not in ORIENTS:
+        return Response(encode({'error': f'orient must be one of {", ".join(ORIENTS)}'}), 400, mimetype=JSON_MIMETYPE)
+    return Response(encode(payload, orient), status, headers, mimetype=JSON_MIMETYPE)
+
+
+def compress(response):
+    """after_request hook: gzip (or brotli when installed) large responses the client accepts"""
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers):
+        return response
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_SIZE:
+        return response
+
+    if brotli is not None and request.accept_encodings['br']:
+        response.set_data(brotli.compress(body, quality=4))
+        response.headers['Content-Encoding'] = 'br'
+    elif request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(body, compresslevel=5))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        return response
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify() through encode(), so ObjectIds and NumPy values serialize directly"""
+
+    def dumps(self, obj, **kwargs):
+        return encode(obj).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(encode(obj) + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,175 @@
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from pymongo.errors import PyMongoError
+
+from loader import concat_frames, load_bills, load_market_demand, load_products
+
+# Immutable view handed to the routes. A refresh never touches the frames of an
+# existing Snapshot, it builds new ones and swaps the tuple.
+Snapshot = namedtuple('Snapshot', ['bills', 'products', 'market_demand', 'version'])
+
+
+class DataSnapshot:
+    def __init__(self, db, refresh_interval=5, full_reload_interval=600, background_refresh=True):
+        """Keep bills, products and market_demand in memory as DataFrames.
+
+        With background_refresh a stale snapshot is still served while a
+        background thread pulls the changes, so only the very first get()
+        waits for MongoDB.
+        """
+        self.db = db
+        self.bills_collection = db['bills']
+        self.products_collection = db['products']
+        self.market_demand_collection = db['market_demand']
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._last_bill_id = None
+        self._last_refresh = 0.0
+        self._last_full_reload = 0.0
+        self.background_refresh = background_refresh
+
+        self._dirty = set()
+        self._watching = False
+        self._refreshing = False
+        self._refreshing_lock = threading.Lock()
+
+    def get(self):
+        """Return the current snapshot, refreshing it first if it has gone stale"""
+        if self._snapshot is None:
+            return self.refresh()
+        if self._dirty or time.monotonic() - self._last_refresh >= self.refresh_interval:
+            if self.background_refresh:
+                self._refresh_in_background()
+            else:
+                self.refresh()
+        return self._snapshot
+
+    def refresh(self, force=False):
+        """Pull new bills by _id watermark and reload whatever the watcher marked as changed"""
+        with self._lock:
+            now = time.monotonic()
+            if (not force and self._snapshot is not None and not self._dirty
+                    and now - self._last_refresh < self.refresh_interval):
+                return self._snapshot
+
+            if self._snapshot is None or force:
+                bills = self._load_bills()
+                products = load_products(self.products_collection)
+                market_demand = load_market_demand(self.market_demand_collection)
+                self._last_full_reload = now
+                changed = True
+            else:
+                dirty, self._dirty = self._dirty, set()
+                if not self._watching and now - self._last_full_reload >= self.full_reload_interval:
+                    # Without change streams a periodic full reload reconciles bill
+                    # updates (e.g. payment type changes)
+                    bills, changed = self._reload_bills()
+                    self._last_full_reload = now
+                else:
+                    bills, changed = self._append_new_bills(dirty)
+
+                # Without a change stream there is no way to see product updates,
+                # so the (small) catalogue collections are re-read on every refresh.
+                products = self._snapshot.products
+                if 'products' in dirty or not self._watching:
+                    products, reloaded = self._reload(load_products, self.products_collection, products)
+                    changed |= reloaded
+
+                market_demand = self._snapshot.market_demand
+                if 'market_demand' in dirty or not self._watching:
+                    market_demand, reloaded = self._reload(load_market_demand, self.market_demand_collection, market_demand)
+                    changed |= reloaded
+
+            version = self._snapshot.version if self._snapshot is not None else 0
+            if changed:
+                version += 1
+            self._snapshot = Snapshot(bills, products, market_demand, version)
+            self._last_refresh = now
+            return self._snapshot
+
+    def _refresh_in_background(self):
+        # At most one refresh thread at a time. refresh() holds self._lock while
+        # loading, so the flag has its own lock to never block the caller.
+        with self._refreshing_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except PyMongoError:
+                # Keep serving the current snapshot, the next get() retries
+                pass
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name='snapshot-refresh', daemon=True).start()
+
+    def start_watcher(self):
+        """Watch the collections in a background thread so product and bill updates are picked up"""
+        thread = threading.Thread(target=self._watch, name='snapshot-watcher', daemon=True)
+        thread.start()
+        return thread
+
+    def _watch(self):
+        pipeline = [{'$match': {'ns.coll': {'$in': ['bills', 'products', 'market_demand']}}}]
+        try:
+            with self.db.watch(pipeline) as stream:
+                self._watching = True
+                for change in stream:
+                    collection = change['ns']['coll']
+                    # New bills are picked up by the _id watermark, unless a concurrent
+                    # writer produced an _id below it (ObjectIds are only roughly ordered)
+                    if collection == 'bills' and change['operationType'] == 'insert':
+                        last_bill_id = self._last_bill_id
+                        if last_bill_id is None or change['documentKey']['_id'] > last_bill_id:
+                            continue
+                    with self._lock:
+                        self._dirty.add(collection)
+        except PyMongoError:
+            # Standalone servers do not support change streams, fall back to polling
+            pass
+        finally:
+            self._watching = False
+
+    def _append_new_bills(self, dirty):
+        if 'bills' in dirty:
+            return self._load_bills(), True
+
+        new_bills = load_bills(self.bills_collection, query={'_id': {'$gt': self._last_bill_id}}
+                               if self._last_bill_id is not None else None)
+        if new_bills.empty:
+            return self._snapshot.bills, False
+
+        self._last_bill_id = new_bills['_id'].iloc[-1]
+        return concat_frames([self._snapshot.bills, new_bills]), True
+
+    def _load_bills(self):
+        bills = load_bills(self.bills_collection)
+        self._last_bill_id = bills['_id'].iloc[-1] if not bills.empty else None
+        return bills
+
+    def _reload_bills(self):
+        # Compare by content: categories of an appended frame can be ordered
+        # differently from a fresh load of the same bills
+        bills, current = self._load_bills(), self._snapshot.bills
+        if list(bills.columns) == list(current.columns) and len(bills) == len(current) and np.array_equal(
+                pd.util.hash_pandas_object(bills, index=False).to_numpy(),
+                pd.util.hash_pandas_object(current, index=False).to_numpy()):
+            return current, False
+        return bills, True
+
+    def _reload(self, load, collection, current):
+        # Keep the existing frame (and version) when nothing actually changed
+        frame = load(collection)
+        if frame.equals(current):
+            return current, False
+        return frame, True
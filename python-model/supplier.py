@@ -4,17 +4,56 @@ from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.metrics import mean_squared_error, classification_report
-import tensorflow as tf
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Dense, Dropout, BatchNormalization
-import matplotlib.pyplot as plt
+from sklearn.neural_network import MLPClassifier
+
+
+class KerasClassifier:
+    def __init__(self, input_dim, epochs=100, batch_size=32):
+        """Keras network behind the same fit/predict_proba/score interface as sklearn"""
+        # TensorFlow is only imported when this backend is actually used
+        from tensorflow.keras.models import Sequential
+        from tensorflow.keras.layers import Dense, Dropout, BatchNormalization
+
+        self.epochs = epochs
+        self.batch_size = batch_size
+        # One softmax output per encoded label, like sklearn's classes_
+        self.classes_ = np.arange(3)
+        self.model = Sequential([
+            Dense(128, activation='relu', input_dim=input_dim),
+            BatchNormalization(),
+            Dropout(0.3),
+            Dense(64, activation='relu'),
+            BatchNormalization(),
+            Dropout(0.2),
+            Dense(32, activation='relu'),
+            Dense(3, activation='softmax')
+        ])
+        
+        self.model.compile(optimizer='adam',
+                           loss='sparse_categorical_crossentropy',
+                           metrics=['accuracy'])
+
+    def fit(self, X, y):
+        self.model.fit(X, y, epochs=self.epochs, batch_size=self.batch_size, verbose=0)
+        return self
+
+    def predict_proba(self, X):
+        return self.model.predict(X, verbose=0)
+
+    def score(self, X, y):
+        return self.model.evaluate(X, y, verbose=0)[1]
+
 
 class SupplierAnalysis:
-    def __init__(self):
+    def __init__(self, classifier_backend='sklearn'):
+        """classifier_backend is 'sklearn' (default, no TensorFlow needed) or 'keras'"""
+        self.classifier_backend = classifier_backend
         self.gb_model = None
         self.dl_model = None
         self.scaler = None
         self.label_encoder = None
+        self._cache_key = None
+        self._cached_results = None
         
     def create_supplier_features(self, df):
         df['total_value'] = df['price'] * df['stock']
@@ -54,24 +93,21 @@ class SupplierAnalysis:
         return X_test, y_test
 
     def create_dl_classifier(self, input_dim):
-        model = Sequential([
-            Dense(128, activation='relu', input_dim=input_dim),
-            BatchNormalization(),
-            Dropout(0.3),
-            Dense(64, activation='relu'),
-            BatchNormalization(),
-            Dropout(0.2),
-            Dense(32, activation='relu'),
-            Dense(3, activation='softmax')
-        ])
-        
-        model.compile(optimizer='adam',
-                     loss='sparse_categorical_crossentropy',
-                     metrics=['accuracy'])
-        
-        return model
+        if self.classifier_backend == 'keras':
+            return KerasClassifier(input_dim)
+        if self.classifier_backend != 'sklearn':
+            raise ValueError(f"Unknown classifier backend: {self.classifier_backend}")
+
+        # Same layer sizes as the Keras network, small enough for a few dozen suppliers
+        return MLPClassifier(hidden_layer_sizes=(128, 64, 32), activation='relu',
+                             solver='adam', max_iter=500, random_state=42)
 
     def analyze_suppliers(self, df):
+        # Reuse the fitted models and results while the supplier data is unchanged
+        cache_key = self._data_key(df)
+        if cache_key == self._cache_key:
+            return self._cached_results
+
         supplier_metrics = self.create_supplier_features(df)
         supplier_metrics = self.create_performance_labels(supplier_metrics)
         
@@ -91,17 +127,20 @@ class SupplierAnalysis:
         X_test_scaled = self.scaler.transform(X_test)
         
         self.dl_model = self.create_dl_classifier(X_train.shape[1])
-        self.dl_model.fit(X_train_scaled, y_train, epochs=100, batch_size=32, verbose=0)
+        self.dl_model.fit(X_train_scaled, y_train)
         
-        supplier_predictions = self.dl_model.predict(X_test_scaled)
-        predicted_classes = np.argmax(supplier_predictions, axis=1)
+        supplier_predictions = self.dl_model.predict_proba(X_test_scaled)
+        # predict_proba has a column per class seen in training, map positions back to labels
+        predicted_classes = self.dl_model.classes_[np.argmax(supplier_predictions, axis=1)]
         
-        return {
+        self._cached_results = {
             'supplier_metrics': supplier_metrics,
             'stock_rmse': stock_rmse,
             'performance_distribution': supplier_metrics['performance_label'].value_counts(),
-            'model_accuracy': self.dl_model.evaluate(X_test_scaled, y_test, verbose=0)[1]
+            'model_accuracy': self.dl_model.score(X_test_scaled, y_test)
         }
+        self._cache_key = cache_key
+        return self._cached_results
 
     def predict_stock(self, price, supply_frequency, total_value):
         if self.gb_model is None:
@@ -112,6 +151,14 @@ class SupplierAnalysis:
         if self.dl_model is None or self.scaler is None:
             raise ValueError("Model not trained. Please run analyze_suppliers first.")
         scaled_features = self.scaler.transform([features])
-        predictions = self.dl_model.predict(scaled_features)
-        predicted_class = np.argmax(predictions, axis=1)[0]
+        predictions = self.dl_model.predict_proba(scaled_features)
+        predicted_class = self.dl_model.classes_[np.argmax(predictions, axis=1)[0]]
         return self.label_encoder.inverse_transform([predicted_class])[0]
+
+    def _data_key(self, df):
+        if df.empty:
+            return (0,)
+        # Column order and Mongo _ids are irrelevant to the analysis
+        columns = sorted(column for column in df.columns if column != '_id')
+        hashed = pd.util.hash_pandas_object(df[columns].astype(str), index=False)
+        return (len(df), tuple(columns), int(hashed.sum()))
@@ -0,0 +1,40 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AnalyticsPool:
+    def __init__(self, max_workers=None):
+        """Bounded pool for heavy analytics with single-flight deduplication.
+
+        Concurrent calls with the same key share one computation: the first
+        submits it and the rest wait on the same future. Threads rather than
+        processes, since the computations read the shared in-memory snapshot
+        and pandas/scikit-learn release the GIL for most of their work.
+        """
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='analytics')
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Future for fn(*args, **kwargs), joining an in-flight call with the same key"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = self._executor.submit(fn, *args, **kwargs)
+            self._inflight[key] = future
+        future.add_done_callback(lambda done: self._finish(key, done))
+        return future
+
+    def run(self, key, fn, *args, timeout=None, **kwargs):
+        """Wait for the (possibly shared) result of fn"""
+        return self.submit(key, fn, *args, **kwargs).result(timeout)
+
+    def inflight(self):
+        with self._lock:
+            return list(self._inflight)
+
+    def _finish(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]